@@ -2,30 +2,72 @@ import sublime
 import sublime_plugin
 import json
 import subprocess
+import signal
 import re
 import os
 import plistlib
+import mmap
 import collections
+import codecs
+import contextlib
+import hashlib
+import xml.etree.ElementTree as ElementTree
 import shutil
+import fnmatch
 import webbrowser
+import tempfile
+import uuid
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from os.path import basename
-from io import StringIO
+from io import StringIO, BytesIO
 from zipfile import ZipFile
-from urllib.request import urlopen
+from urllib.request import urlopen, Request
 from urllib.request import urlretrieve
 
 PLUGIN_FOLDER = os.path.dirname(os.path.realpath(__file__))
 PLUGIN_NAME = "Titanium"
 SETTINGS_FILE = PLUGIN_NAME + ".sublime-settings"
 SETTINGS_PREFIX = PLUGIN_NAME.lower() + '_'
+DAEMON_SCRIPT = os.path.join(PLUGIN_FOLDER, "TitaniumDaemon.js")
+
+def cacheFolder():
+	# next to the plugin when it is unpacked, in Sublime's cache folder for a packed .sublime-package
+	if os.path.isdir(PLUGIN_FOLDER) and os.access(PLUGIN_FOLDER, os.W_OK):
+		return os.path.join(PLUGIN_FOLDER, ".cache")
+	return os.path.join(sublime.cache_path() or tempfile.gettempdir(), PLUGIN_NAME)
+
+CACHE_FOLDER = cacheFolder()
+PROVISIONING_PROFILES_DIR = os.path.expanduser('~/Library/MobileDevice/Provisioning Profiles')
+AVD_DIR = os.path.expanduser('~/.android/avd')
+XCODE_SELECT_LINK = '/var/db/xcode_select_link'
+SIMULATOR_DEVICE_SET = os.path.expanduser('~/Library/Developer/CoreSimulator/Devices/device_set.plist')
+SIMULATOR_DEVICES_DIR = os.path.dirname(SIMULATOR_DEVICE_SET)
+# SimDeviceState in a device's device.plist
+SIMULATOR_STATE_BOOTED = 3
+
+PREFETCH_TTL = 60
+FONTELLO_HOST = "http://fontello.com"
+# downloaded archives bigger than this spill from memory to a temp file
+MAX_FONTELLO_BUFFER = 8 * 1024 * 1024
 
 FILE_REGEX = "((?:\/[@a-zA-Z0-9_\-\s\.]+)+\.\d*[a-zA-Z][a-zA-Z0-9]*)(?::(\d+))?(?::(\d+))?"
+FILE_PATTERN = re.compile(FILE_REGEX)
+LEVEL_PATTERN = re.compile(r'\[(ERROR|WARN)\]')
+PHASE_PATTERN = re.compile(r'^\[INFO\]\s+(Alloy|Compiling|Processing|Copying|Minifying|Packaging|Signing|Invoking|Installing|Launching)\b')
+CHUNK_SIZE = 65536
+MAX_DIAGNOSTICS = 1000
 
 settings = sublime.load_settings(SETTINGS_FILE)
 
 my_session_settings = {}
 
+executor = ThreadPoolExecutor(max_workers=4)
+# project scans get their own workers, the build menu waits for them and must not queue behind slow CLI calls
+scanExecutor = ThreadPoolExecutor(max_workers=2)
+
 def sessionSetting(name, value = 'Nopennada'):
 	realName = name + '_'+str(sublime.active_window().id())
 	if value == "Nopennada":
@@ -45,93 +87,1886 @@ def sessionRemoveSetting(name):
 
 
 
+#--------------------------------------------------------------
+# SETTINGS
+#--------------------------------------------------------------
+
+# expected type of every setting, a value of another type is reported once and the default used instead
+# (float accepts any number)
+SETTING_TYPES = {
+	"nodejs": str, "titaniumCLI": str, "androidSDK": str, "loggingLevel": str,
+	"iosVersion": str, "outputDir": str, "iosCertsDir": str, "iosKeychain": str,
+	"android.keystore": str, "android.alias": str,
+	"buildMatrix": list, "buildMatrixConcurrency": int, "useStockExec": bool,
+	"maxOutputLines": int, "spillBuildLog": bool, "historySize": int,
+	"fontelloExtras": bool, "fontelloCompactModule": bool, "fontelloSessionExpiry": float, "fontelloValidateSessions": bool,
+	"cliTimeout": float, "cliDaemon": bool, "cliDaemonIdleTimeout": float, "iosSimctlFixture": str,
+	"projectScanDepth": int, "projectIgnores": list, "watchMode": bool, "watchDebounce": float,
+	"reuseArtifacts": bool, "cleanInBackground": bool,
+	"benchmarkRuns": int, "benchmarkCliLatency": float, "benchmarkPython": str
+}
+SETTING_CHOICES = {
+	"loggingLevel": ("trace", "debug", "info", "warn", "error")
+}
+MISSING = object()
+
+def settingEnvName(key):
+	# android.keystore -> TITANIUM_ANDROID_KEYSTORE
+	return PLUGIN_NAME.upper() + "_" + re.sub(r'[^A-Za-z0-9]', '_', key).upper()
+
+def parseEnvSetting(key, text):
+	kind = SETTING_TYPES.get(key, str)
+	if kind is bool:
+		return text.strip().lower() in ("1", "true", "yes", "on")
+	if kind in (list, dict):
+		return json.loads(text)
+	return kind(text)
+
+class SettingsResolver(object):
+
+	# user settings < project "settings" (titanium_<key>) < TITANIUM_<KEY> environment variables,
+	# resolved once per window and key until the settings or the project file change
+	def __init__(self):
+		self.snapshots = {}
+		self.reported = set()
+
+	def invalidate(self, window=None):
+		if window is None:
+			self.snapshots.clear()
+		else:
+			self.snapshots.pop(window.id(), None)
+
+	def snapshot(self, window):
+		key = window.id() if window is not None else None
+		snapshot = self.snapshots.get(key)
+		if snapshot is None:
+			project = (window.project_data() or {}).get("settings", {}) if window is not None else {}
+			snapshot = self.snapshots[key] = {'project': project, 'values': {}}
+		return snapshot
+
+	def get(self, window, key, default=None):
+		snapshot = self.snapshot(window)
+		values = snapshot['values']
+		if key not in values:
+			values[key] = self.resolve(snapshot['project'], key)
+		value = values[key]
+		return default if value is MISSING else value
+
+	def resolve(self, project, key):
+		value = MISSING
+		if settings.has(key):
+			value = self.validate(key, settings.get(key), "user settings")
+		if SETTINGS_PREFIX + key in project:
+			value = self.validate(key, project[SETTINGS_PREFIX + key], "project settings", value)
+		env = os.environ.get(settingEnvName(key))
+		if env is not None:
+			try:
+				value = self.validate(key, parseEnvSetting(key, env), settingEnvName(key), value)
+			except ValueError as e:
+				self.report(key, env, settingEnvName(key), str(e))
+		return value
+
+	def validate(self, key, value, source, fallback=MISSING):
+		kind = SETTING_TYPES.get(key)
+		if kind is None or value is None:
+			return value
+		if kind is float:
+			valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+		elif kind is int:
+			valid = isinstance(value, int) and not isinstance(value, bool)
+		elif kind is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+			# versions like "iosVersion": 6.1 are written as numbers in the JSON
+			value, valid = str(value), True
+		else:
+			valid = isinstance(value, kind)
+		if not valid:
+			self.report(key, value, source, "expected " + kind.__name__)
+			return fallback
+		if key in SETTING_CHOICES and value not in SETTING_CHOICES[key]:
+			self.report(key, value, source, "expected one of " + ", ".join(SETTING_CHOICES[key]))
+			return fallback
+		return value
+
+	def report(self, key, value, source, reason):
+		if (key, repr(value)) not in self.reported:
+			self.reported.add((key, repr(value)))
+			print("Titanium: ignoring " + key + "=" + repr(value) + " from " + source + ", " + reason)
+
+settingsResolver = SettingsResolver()
+
 def get_setting(key, default=None, view=None):
-	try:
-		if view == None:
-			view = sublime.active_window().active_view()
+	# titanium_<key> view settings win when a view is given, everything else comes from the window snapshot
+	if view is not None:
 		s = view.settings()
 		if s.has(SETTINGS_PREFIX + key):
-			print('get_setting from view : ' + key + ',' + settings.get(key, default))
-			return s.get(SETTINGS_PREFIX + key)
+			value = settingsResolver.validate(key, s.get(SETTINGS_PREFIX + key), "view settings")
+			if value is not MISSING:
+				return value
+		window = view.window()
+	else:
+		window = sublime.active_window()
+	return settingsResolver.get(window, key, default)
+
+def fileDigest(path):
+	digest = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(65536), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+def writeIfChanged(path, data):
+	# leaves the file (and its mtime) alone when the content is the same, returns whether it was written
+	if isinstance(data, str):
+		data = data.encode('utf-8')
+	try:
+		if os.path.getsize(path) == len(data):
+			with open(path, 'rb') as f:
+				if f.read() == data:
+					return False
+	except OSError:
+		pass
+	writeFileAtomic(path, data)
+	return True
+
+def linkOrCopy(src, dest):
+	# a hardlink costs nothing when both paths are on the same filesystem
+	tmpPath = dest + '.' + str(os.getpid()) + '.tmp'
+	try:
+		os.link(src, tmpPath)
+	except OSError:
+		shutil.copy2(src, tmpPath)
+	os.replace(tmpPath, dest)
+
+def readJSONFile(path, default=None):
+	try:
+		with open(path, encoding='utf-8', mode='r') as f:
+			return json.load(f)
+	except (IOError, ValueError):
+		return default
+
+def writeFileAtomic(path, data):
+	# write through a temp file so a concurrent reader never sees a partial file
+	folder = os.path.dirname(path)
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+	tmpPath = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+	if isinstance(data, str):
+		f = open(tmpPath, encoding='utf-8', mode='w', newline='')
+	else:
+		f = open(tmpPath, mode='wb')
+	try:
+		with f:
+			f.write(data)
+		if os.path.isfile(path):
+			shutil.copymode(path, tmpPath)
+		os.replace(tmpPath, path)
 	except:
+		if os.path.isfile(tmpPath):
+			os.remove(tmpPath)
+		raise
+
+def writeJSONFile(path, data):
+	writeFileAtomic(path, json.dumps(data))
+
+def pathMTime(path):
+	try:
+		return os.stat(path).st_mtime
+	except OSError:
+		return 0
+
+#--------------------------------------------------------------
+# TIMINGS
+#--------------------------------------------------------------
+
+MAX_TIMING_SAMPLES = 200
+timingsLock = threading.Lock()
+
+def timingsPath(projectDir):
+	return os.path.join(CACHE_FOLDER, "timings", hashlib.sha1(projectDir.encode('utf-8')).hexdigest()[:12] + ".json")
+
+def recordTimings(projectDir, durations):
+	# rolling log of the last MAX_TIMING_SAMPLES durations of every phase, best effort
+	with timingsLock:
+		path = timingsPath(projectDir)
+		log = readJSONFile(path, {"project": projectDir, "samples": {}})
+		for phase, duration in durations.items():
+			samples = log["samples"].setdefault(phase, [])
+			samples.append(round(duration, 3))
+			del samples[:-MAX_TIMING_SAMPLES]
+		try:
+			writeJSONFile(path, log)
+		except OSError as e:
+			print("Titanium: could not write timings: " + str(e))
+
+@contextlib.contextmanager
+def timed(projectDir, phase):
+	start = time.time()
+	yield
+	recordTimings(projectDir, {phase: time.time() - start})
+
+def percentile(values, pct):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+def timingsReport(projectDir):
+	log = readJSONFile(timingsPath(projectDir))
+	if not log or not log["samples"]:
+		return os.path.basename(projectDir) + ": no timings recorded yet\n"
+	lines = [os.path.basename(projectDir), "%-32s %6s %9s %9s" % ("phase", "runs", "p50", "p95")]
+	for phase, samples in sorted(log["samples"].items()):
+		lines.append("%-32s %6d %8.2fs %8.2fs" % (phase, len(samples), percentile(samples, 50), percentile(samples, 95)))
+	return "\n".join(lines) + "\n"
+
+#--------------------------------------------------------------
+# CLI RUNNER
+#--------------------------------------------------------------
+
+class CliError(Exception):
+
+	def __init__(self, message, stderr='', returncode=None):
+		Exception.__init__(self, message + ('\n' + stderr if stderr else ''))
+		self.stderr = stderr
+		self.returncode = returncode
+
+cliProcesses = {}
+cliLock = threading.Lock()
+
+def showCliStatus():
+	with cliLock:
+		labels = list(cliProcesses.values())
+	for window in sublime.windows():
+		view = window.active_view()
+		if view is None:
+			continue
+		if labels:
+			view.set_status('titanium', 'Titanium: ' + ', '.join(labels) + '... (cancel with "Titanium: Cancel")')
+		else:
+			view.erase_status('titanium')
+
+def runCli(cmd, label=None, timeout=None):
+	# blocking, call it from a worker thread. Raises CliError on failure, timeout or cancellation
+	if timeout is None:
+		timeout = float(get_setting("cliTimeout", 120))
+	print(" ".join(cmd))
+	process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	with cliLock:
+		cliProcesses[process] = label or " ".join(cmd[2:4])
+	sublime.set_timeout(showCliStatus, 0)
+	try:
+		result, error = process.communicate(timeout=timeout)
+	except subprocess.TimeoutExpired:
+		process.kill()
+		result, error = process.communicate()
+		raise CliError(cliProcesses[process] + " timed out after %gs" % timeout, error.decode('utf-8', 'replace'))
+	finally:
+		with cliLock:
+			label = cliProcesses.pop(process)
+		sublime.set_timeout(showCliStatus, 0)
+	if process.returncode != 0:
+		raise CliError(label + (" was cancelled" if process.returncode < 0 else " failed with exit code %d" % process.returncode), error.decode('utf-8', 'replace'), process.returncode)
+	return result
+
+def cancelCli():
+	with cliLock:
+		processes = list(cliProcesses)
+	for process in processes:
+		if process.poll() is None:
+			process.terminate()
+	stopCliDaemons()
+	return len(processes)
+
+class CliDaemon(object):
+
+	# one TitaniumDaemon.js process keeping the CLI loaded, talking JSON lines over stdin/stdout
+	def __init__(self, node, cli, sdk):
+		self.sdk = sdk
+		self.process = subprocess.Popen([node, DAEMON_SCRIPT, cli], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		self.pending = {}
+		self.nextId = 0
+		self.lock = threading.Lock()
+		self.lastUsed = time.time()
+		self.idleTimer = None
+		self.dead = False
+		threading.Thread(target=self.read, daemon=True).start()
+
+	def read(self):
+		for line in iter(self.process.stdout.readline, b''):
+			try:
+				response = json.loads(line.decode('utf-8'))
+			except ValueError:
+				continue
+			pending = self.pending.pop(response.get('id'), None)
+			if pending is not None:
+				pending[1] = response
+				pending[0].set()
+		# the daemon died, wake everybody up
+		self.dead = True
+		for event, response in list(self.pending.values()):
+			event.set()
+
+	def alive(self):
+		return self.process.poll() is None
+
+	def request(self, args, label, timeout):
+		with self.lock:
+			self.nextId += 1
+			pending = self.pending[self.nextId] = [threading.Event(), None]
+			if self.dead:
+				raise CliError(label + ": the CLI daemon exited")
+			try:
+				self.process.stdin.write((json.dumps({'id': self.nextId, 'args': args}) + '\n').encode('utf-8'))
+				self.process.stdin.flush()
+			except (IOError, ValueError) as e:
+				raise CliError(label + ": could not talk to the CLI daemon, " + str(e))
+		if not pending[0].wait(timeout):
+			self.stop()
+			raise CliError(label + " timed out after %gs in the CLI daemon" % timeout)
+		response = pending[1]
+		if response is None:
+			raise CliError(label + ": the CLI daemon exited")
+		stderr = response.get('stderr', '')
+		if 'error' in response:
+			raise CliError(label + " failed in the CLI daemon", (stderr + response['error']).strip())
+		if response['code'] != 0:
+			raise CliError(label + " failed with exit code %d" % response['code'], stderr, response['code'])
+		self.touch()
+		return response['stdout'].encode('utf-8')
+
+	def touch(self):
+		# shut down after cliDaemonIdleTimeout seconds without requests
+		self.lastUsed = time.time()
+		if self.idleTimer is not None:
+			self.idleTimer.cancel()
+		self.idleTimer = threading.Timer(float(get_setting("cliDaemonIdleTimeout", 600)), self.stop)
+		self.idleTimer.daemon = True
+		self.idleTimer.start()
+
+	def stop(self):
+		if self.idleTimer is not None:
+			self.idleTimer.cancel()
+		if self.alive():
+			self.process.stdin.close()
+			self.process.terminate()
+
+cliDaemons = {}
+
+def getCliDaemon(node, cli, sdk):
+	# one helper per sdk, restarted when it died
+	with cliLock:
+		daemon = cliDaemons.get((node, cli, sdk))
+		if daemon is None or not daemon.alive():
+			daemon = cliDaemons[(node, cli, sdk)] = CliDaemon(node, cli, sdk)
+		return daemon
+
+def stopCliDaemons():
+	with cliLock:
+		daemons = list(cliDaemons.values())
+		cliDaemons.clear()
+	for daemon in daemons:
+		daemon.stop()
+
+def runCliQuery(node, cli, sdk, args, label):
+	# goes through the long running CLI daemon when enabled, a plain CLI call otherwise or when it fails
+	if get_setting("cliDaemon", False) and os.path.isfile(DAEMON_SCRIPT):
+		daemon = None
+		try:
+			daemon = getCliDaemon(node, cli, sdk)
+			return daemon.request(["--sdk", sdk] + args, label, float(get_setting("cliTimeout", 120)))
+		except (CliError, OSError) as e:
+			if getattr(e, 'returncode', None):
+				# the CLI itself failed, running it again without the daemon would not help
+				raise
+			print("CLI daemon failed, falling back to a plain CLI call: " + str(e))
+			if daemon is not None:
+				# only the helper that failed, another thread may have started a healthy one meanwhile
+				with cliLock:
+					if cliDaemons.get((node, cli, sdk)) is daemon:
+						del cliDaemons[(node, cli, sdk)]
+				daemon.stop()
+	return runCli([node, cli, "--sdk", sdk] + args, label)
+
+def runInBackground(fn, callback, errback=None):
+	# fn runs on the worker pool, callback(result) or errback(exception) on the main thread
+	def done(future):
+		try:
+			result = future.result()
+		except Exception as e:
+			if errback is not None:
+				errback(e)
+			else:
+				print(e)
+			return
+		callback(result)
+	whenDone(executor.submit(fn), done)
+
+#--------------------------------------------------------------
+# ENVIRONMENT INFO CACHE
+#--------------------------------------------------------------
+
+def cliVersion(cli):
+	# the CLI is usually a symlink into its npm package, read the version from there
+	cliPath = os.path.realpath(cli)
+	folder = os.path.dirname(cliPath)
+	for i in range(3):
+		package = readJSONFile(os.path.join(folder, "package.json"))
+		if package and 'version' in package:
+			return package['version']
+		folder = os.path.dirname(folder)
+	return pathMTime(cliPath)
+
+def selectedXcodePath():
+	path = os.environ.get('DEVELOPER_DIR')
+	if path is None and os.path.lexists(XCODE_SELECT_LINK):
+		path = os.path.realpath(XCODE_SELECT_LINK)
+	if path is None:
+		return None
+	return [path, pathMTime(path)]
+
+def infoFingerprint(platform, cli):
+	fingerprint = {'cli': cliVersion(cli)}
+	if platform == 'ios':
+		fingerprint['profiles'] = pathMTime(PROVISIONING_PROFILES_DIR)
+		fingerprint['xcode'] = selectedXcodePath()
+	elif platform == 'android':
+		fingerprint['avds'] = pathMTime(AVD_DIR)
+	return fingerprint
+
+def infoCachePath(platform, sdk):
+	return os.path.join(CACHE_FOLDER, "info_" + platform + "_" + re.sub(r'[^\w.-]', '_', str(sdk)) + ".json")
+
+def clearInfoCache():
+	if os.path.isdir(CACHE_FOLDER):
+		for f in os.listdir(CACHE_FOLDER):
+			if f.startswith("info_"):
+				# a fetch still running on a worker may be renaming its temp file right now
+				try:
+					os.remove(os.path.join(CACHE_FOLDER, f))
+				except OSError:
+					pass
+
+def fetchInfo(node, cli, sdk, projectDir, platform, refresh=False):
+	# only the CLI call is timed, cache hits would hide its cost in the report
+	cachePath = infoCachePath(platform, sdk)
+	fingerprint = infoFingerprint(platform, cli)
+	if not refresh:
+		cached = readJSONFile(cachePath)
+		if cached and cached.get('fingerprint') == fingerprint:
+			return cached['info']
+	with timed(projectDir, "info " + platform):
+		args = ["--project-dir", projectDir, "info", "--types", platform, "--log-level", "error", "--output", "json"]
+		result = runCliQuery(node, cli, sdk, args, "info " + platform)
+	info = json.loads(result.decode('utf-8'))
+	try:
+		writeJSONFile(cachePath, {'fingerprint': fingerprint, 'info': info})
+	except OSError as e:
+		print("Titanium: could not cache the " + platform + " info: " + str(e))
+	return info
+
+#--------------------------------------------------------------
+# ANDROID DEVICES
+#--------------------------------------------------------------
+
+avdCache = {}
+
+def readIniFile(path):
+	values = {}
+	try:
+		with open(path, encoding='utf-8', mode='r') as f:
+			for line in f:
+				if '=' in line:
+					key, value = line.split('=', 1)
+					values[key.strip()] = value.strip()
+	except IOError:
 		pass
-	if settings.has(key):
-		print('get_setting: ' + key + ',' + settings.get(key, default))
-		return settings.get(key, default)
+	return values
+
+def listAvds():
+	# the <name>.ini files of ~/.android/avd, re-read only when the folder changes
+	mtime = pathMTime(AVD_DIR)
+	if avdCache.get('mtime') != mtime:
+		avds = []
+		if os.path.isdir(AVD_DIR):
+			for f in sorted(os.listdir(AVD_DIR)):
+				if f.endswith('.ini'):
+					ini = readIniFile(os.path.join(AVD_DIR, f))
+					avds.append({'name': f[:-len('.ini')], 'target': ini.get('target', ''), 'path': ini.get('path', '')})
+		avdCache['mtime'] = mtime
+		avdCache['avds'] = avds
+	return avdCache['avds']
+
+def adbPath(androidSDK):
+	adb = os.path.join(androidSDK, "platform-tools", "adb")
+	if os.path.isfile(adb):
+		return adb
+	return shutil.which("adb")
+
+def listRunningDevices(androidSDK):
+	# [{'serial', 'model', 'avd'}] of the devices and emulators adb can see, empty without adb
+	adb = adbPath(androidSDK)
+	if adb is None:
+		return []
+	devices = []
+	for line in runCli([adb, "devices", "-l"], "adb devices", timeout=15).decode('utf-8', 'replace').splitlines()[1:]:
+		parts = line.split()
+		if len(parts) < 2 or parts[1] != "device":
+			continue
+		device = {'serial': parts[0], 'model': parts[0], 'avd': None}
+		for part in parts[2:]:
+			if part.startswith("model:"):
+				device['model'] = part[len("model:"):].replace('_', ' ')
+		if device['serial'].startswith("emulator-"):
+			try:
+				device['avd'] = runCli([adb, "-s", device['serial'], "emu", "avd", "name"], "adb emu", timeout=5).decode('utf-8', 'replace').splitlines()[0].strip()
+			except (CliError, IndexError):
+				pass
+		devices.append(device)
+	return devices
+
+def discoverAndroidDevices(androidSDK):
+	try:
+		running = listRunningDevices(androidSDK)
+	except CliError as e:
+		print(e)
+		running = []
+	return running, listAvds()
+
+#--------------------------------------------------------------
+# IOS SIMULATORS
+#--------------------------------------------------------------
+
+def runtimeName(key):
+	# "com.apple.CoreSimulator.SimRuntime.iOS-17-0" -> "iOS 17.0", older Xcodes already use "iOS 10.0"
+	m = re.match(r'com\.apple\.CoreSimulator\.SimRuntime\.([a-zA-Z]+)-(.*)', key)
+	if m is None:
+		return key
+	return m.group(1) + ' ' + m.group(2).replace('-', '.')
+
+def deviceFamily(name):
+	for prefix, family in (("iPhone", "iphone"), ("iPad", "ipad"), ("iPod", "iphone"), ("Apple Watch", "watch"), ("Apple TV", "tv")):
+		if name.startswith(prefix):
+			return family
+	return "other"
+
+def listSimulators(simctl):
+	# available [name, udid, runtime, family] rows, the part of simctl's output worth caching
+	devices = []
+	for key, entries in simctl.get("devices", {}).items():
+		runtime = runtimeName(key)
+		for device in entries:
+			if device.get("isAvailable", device.get("availability") == "(available)"):
+				devices.append([device["name"], device["udid"], runtime, deviceFamily(device["name"])])
+	return devices
+
+def bootedInSimctl(simctl):
+	return set(device["udid"] for entries in simctl.get("devices", {}).values() for device in entries if device.get("state") == "Booted")
+
+def simulatorBooted(udid):
+	# simctl reads the state from the device's own plist, cheaper than asking it again
+	try:
+		with open(os.path.join(SIMULATOR_DEVICES_DIR, udid, "device.plist"), 'rb') as f:
+			return plistLoads(f.read()).get('state') == SIMULATOR_STATE_BOOTED
+	except Exception:
+		return False
+
+def indexSimulators(devices, booted):
+	# [name, udid, runtime, family, booted] rows, booted ones first, plus their indexes by runtime
+	devices = [device[:4] + [device[1] in booted] for device in devices]
+	def version(runtime):
+		return [int(part) if part.isdigit() else 0 for part in re.findall(r'\d+', runtime)]
+	devices.sort(key=lambda device: (not device[4], [-v for v in version(device[2])], device[0]))
+	byRuntime = {}
+	for i, device in enumerate(devices):
+		byRuntime.setdefault(device[2], []).append(i)
+	return {'devices': devices, 'byRuntime': byRuntime}
+
+def discoverIosSimulators():
+	# the device list is cached until the device set changes, whether a device is booted is read fresh
+	fixture = get_setting("iosSimctlFixture", "")
+	if fixture:
+		fingerprint = [fixture, pathMTime(fixture)]
+	elif sublime.platform() == "osx":
+		fingerprint = [SIMULATOR_DEVICE_SET, pathMTime(SIMULATOR_DEVICE_SET), selectedXcodePath()]
 	else:
-		print('get_setting: ' + key + ',' + default)
-		return default
+		return None
+	simctl = readJSONFile(fixture, {}) if fixture else None
+	cachePath = os.path.join(CACHE_FOLDER, "simulators.json")
+	cached = readJSONFile(cachePath)
+	if cached and cached.get('fingerprint') == fingerprint and 'devices' in cached:
+		devices = cached['devices']
+	else:
+		if simctl is None:
+			simctl = json.loads(runCli(["xcrun", "simctl", "list", "-j", "devices"], "simctl list").decode('utf-8'))
+		devices = listSimulators(simctl)
+		try:
+			writeJSONFile(cachePath, {'fingerprint': fingerprint, 'devices': devices})
+		except OSError as e:
+			print("Titanium: could not cache the simulators: " + str(e))
+	if simctl is not None:
+		booted = bootedInSimctl(simctl)
+	else:
+		booted = set(device[1] for device in devices if simulatorBooted(device[1]))
+	return indexSimulators(devices, booted)
+
+#--------------------------------------------------------------
+# PROVISIONING PROFILES
+#--------------------------------------------------------------
+
+plistLoads = getattr(plistlib, 'loads', None) or plistlib.readPlistFromBytes
+
+# build targets to the kind of profile they are signed with
+PROFILE_TYPES = {"device": "development", "device-adhoc": "adhoc", "dist-adhoc": "adhoc", "dist-appstore": "appstore"}
+
+def plistFromProvFile(path):
+	# the plist is embedded as plain xml inside the CMS envelope
+	with open(path, 'rb') as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			begin = data.find(b'<?xml')
+			end = data.find(b'</plist>', begin)
+			if begin < 0 or end < 0:
+				raise ValueError("no plist found in " + path)
+			return plistLoads(data[begin:end + len(b'</plist>')])
+		finally:
+			data.close()
+
+def profileType(plist):
+	if plist.get('Entitlements', {}).get('get-task-allow'):
+		return "development"
+	if plist.get('ProvisionsAllDevices'):
+		return "enterprise"
+	if plist.get('ProvisionedDevices'):
+		return "adhoc"
+	return "appstore"
+
+def profileEntry(path, stat):
+	plist = plistFromProvFile(path)
+	entitlements = plist.get('Entitlements', {})
+	teamId = plist['TeamIdentifier'][0]
+	appId = entitlements.get('application-identifier', '')
+	if appId.startswith(teamId + '.'):
+		appId = appId[len(teamId) + 1:]
+	expiration = plist.get('ExpirationDate')
+	return {
+		'path': path,
+		'mtime': stat.st_mtime,
+		'size': stat.st_size,
+		'uuid': plist['UUID'],
+		'name': plist.get('Name', ''),
+		'teamName': plist['TeamName'],
+		'teamId': teamId,
+		'appId': appId,
+		'type': profileType(plist),
+		'expiration': time.mktime(expiration.timetuple()) if expiration else None,
+		'entitlements': json.loads(json.dumps(entitlements, default=str))
+	}
+
+class ProfileIndex(object):
+
+	def __init__(self, path):
+		self.path = path
+		self.profiles = None
+		self.byType = {}
+		self.folderLocks = {}
+		# guards profiles, byType and folderLocks, parsing happens under the folder's own lock
+		self.lock = threading.Lock()
+
+	def load(self):
+		with self.lock:
+			if self.profiles is None:
+				self.profiles = readJSONFile(self.path, {})
+			return self.profiles
+
+	def folderLock(self, folder):
+		with self.lock:
+			return self.folderLocks.setdefault(folder, threading.Lock())
+
+	def scan(self, folders):
+		for folder in folders:
+			with self.folderLock(folder):
+				self.scanFolder(folder)
+
+	def scanFolder(self, folder):
+		# only profiles whose path, mtime or size changed get parsed again, unreadable ones included
+		profiles = self.load()
+		found = set()
+		changed = False
+		try:
+			names = os.listdir(folder)
+		except OSError:
+			names = []
+		for name in names:
+			if not name.endswith('.mobileprovision'):
+				continue
+			path = os.path.join(folder, name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			found.add(path)
+			entry = profiles.get(path)
+			if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+				try:
+					entry = profileEntry(path, stat)
+				except Exception as e:
+					print("could not read provisioning profile " + path + ": " + str(e))
+					entry = {'path': path, 'mtime': stat.st_mtime, 'size': stat.st_size, 'error': str(e)}
+				with self.lock:
+					profiles[path] = entry
+				changed = True
+		with self.lock:
+			for path in [path for path in profiles if os.path.dirname(path) == folder and path not in found]:
+				del profiles[path]
+				changed = True
+			byType = {}
+			for entry in profiles.values():
+				if os.path.dirname(entry['path']) == folder and 'error' not in entry:
+					byType.setdefault(entry['type'], []).append(entry)
+			for entries in byType.values():
+				entries.sort(key=lambda entry: entry['expiration'] or 0, reverse=True)
+			self.byType[folder] = byType
+			snapshot = dict(profiles) if changed else None
+		if snapshot is not None:
+			try:
+				writeJSONFile(self.path, snapshot)
+			except OSError as e:
+				print("Titanium: could not cache the provisioning profiles: " + str(e))
+
+	def get(self, path):
+		with self.lock:
+			entry = (self.profiles or {}).get(path)
+		return None if entry is None or 'error' in entry else entry
+
+	def entries(self, folder):
+		with self.lock:
+			return [entry for entries in self.byType.get(folder, {}).values() for entry in entries]
+
+	def find(self, folder, uuid):
+		for entry in self.entries(folder):
+			if entry['uuid'] == uuid:
+				return entry
+		return None
+
+	def lookup(self, folder, target):
+		# newest profile of the kind the target needs
+		with self.lock:
+			entries = self.byType.get(folder, {}).get(PROFILE_TYPES.get(target), [])
+		return entries[0] if entries else None
+
+def profileProblems(entry, appId=None):
+	problems = []
+	if entry['expiration'] is not None and entry['expiration'] < time.time():
+		problems.append("the provisioning profile " + entry['name'] + " expired on " + datetime.fromtimestamp(entry['expiration']).strftime("%Y-%m-%d"))
+	if appId and entry['appId'] and entry['appId'] != '*':
+		if not (appId == entry['appId'] or (entry['appId'].endswith('*') and appId.startswith(entry['appId'][:-1]))):
+			problems.append("the provisioning profile " + entry['name'] + " is for " + entry['appId'] + ", not " + appId)
+	return problems
+
+profileIndex = ProfileIndex(os.path.join(CACHE_FOLDER, "profiles.json"))
+
+def syncProfile(src, uuid, destDir=PROVISIONING_PROFILES_DIR):
+	# returns "added", "updated" or "unchanged"
+	dest = os.path.join(destDir, uuid + '.mobileprovision')
+	if not os.path.isfile(dest):
+		action = "added"
+	elif os.path.samefile(src, dest):
+		return "unchanged"
+	elif os.path.getsize(src) != os.path.getsize(dest) or fileDigest(src) != fileDigest(dest):
+		action = "updated"
+	else:
+		return "unchanged"
+	if not os.path.isdir(destDir):
+		os.makedirs(destDir)
+	print(action + " provisioning profile " + src + " as " + dest)
+	linkOrCopy(src, dest)
+	return action
+
+def syncProvisioningProfiles(srcDir, destDir=PROVISIONING_PROFILES_DIR):
+	# mirror every profile of srcDir into destDir, named after their UUID like Xcode does
+	profileIndex.scan([srcDir])
+	summary = {"added": [], "updated": [], "unchanged": []}
+	for entry in profileIndex.entries(srcDir):
+		summary[syncProfile(entry['path'], entry['uuid'], destDir)].append(entry['name'])
+	return summary
+
+#--------------------------------------------------------------
+# IOS ENVIRONMENT
+#--------------------------------------------------------------
+
+# build target -> provisioningProfiles group of titanium info
+# TODO: figure out what to do with enterprise profiles
+IOS_PROFILE_GROUPS = {
+	"device": "development",
+	"device-adhoc": "adhoc",
+	"dist-adhoc": "adhoc",
+	"dist-appstore": "distribution"
+}
+
+def validCertNames(certs):
+	names = []
+	for cert in certs:
+		if isinstance(cert, str):
+			names.append(cert)
+		elif not cert.get('invalid', False):
+			names.append(cert['name'])
+	return names
+
+class IosEnvironment(object):
+	# the ios part of titanium info, every section is parsed the first time a picker asks for it
+
+	def __init__(self, info):
+		self.info = info
+		self.ios = info.get('ios')
+		self.sections = {}
+
+	def section(self, name, parse):
+		if name not in self.sections:
+			self.sections[name] = parse()
+		return self.sections[name]
+
+	def keychains(self):
+		# keychain name -> {"developer": [cert names], "distribution": [cert names]}, invalid certs left out
+		return self.section('keychains', self.parseKeychains)
+
+	def certs(self, keychain, kind):
+		return self.keychains().get(keychain, {}).get(kind, [])
+
+	def profiles(self, target):
+		# [[name, uuid]] of the profiles usable for the build target
+		group = IOS_PROFILE_GROUPS.get(target)
+		return self.section('profiles:' + str(group), lambda: self.parseProfiles(group))
+
+	def simulators(self):
+		return self.section('simulators', self.parseSimulators)
+
+	def parseKeychains(self):
+		keychains = collections.OrderedDict()
+		if self.ios is not None:
+			for group, c in self.ios.get("certs", {}).items():
+				# skips the "wwdr" flag
+				if not isinstance(c, dict):
+					continue
+				for name, certs in c.items():
+					keychains[name] = {
+						"developer": validCertNames(certs.get("developer", [])),
+						"distribution": validCertNames(certs.get("distribution", []))
+					}
+		else:
+			# info of older CLIs only lists the cert names, the same for every keychain
+			legacy = self.info.get("iosCerts", {})
+			certs = {"developer": list(legacy.get("devNames", [])), "distribution": list(legacy.get("distNames", []))}
+			for name in self.info.get("iosKeychains") or list(self.info.get("keychains", {})):
+				keychains[name] = certs
+		return keychains
+
+	def parseProfiles(self, group):
+		if self.ios is not None:
+			profiles = self.ios.get("provisioningProfiles", {})
+		else:
+			profiles = self.info.get("iOSProvisioningProfiles", {})
+		return [[profile['name'], profile['uuid']] for profile in profiles.get(group, [])]
+
+	def parseSimulators(self):
+		if self.ios is None or "simulators" not in self.ios:
+			return []
+		selectedXcode = self.ios.get("selectedXcode") or {}
+		if "sims" in selectedXcode:
+			return self.ios["simulators"][selectedXcode['sims'][0]]
+		return self.ios["simulators"]
+
+iosEnvironments = collections.OrderedDict()
+
+def iosEnvironmentFor(info):
+	# one model per fetched info, picking another target reuses everything parsed so far
+	key = id(info)
+	environment = iosEnvironments.get(key)
+	if environment is None or environment.info is not info:
+		environment = iosEnvironments[key] = IosEnvironment(info)
+		while len(iosEnvironments) > 4:
+			iosEnvironments.popitem(last=False)
+	return environment
+
+#--------------------------------------------------------------
+# TIAPP.XML
+#--------------------------------------------------------------
+
+TiApp = collections.namedtuple('TiApp', ['sdkVersion', 'id', 'version', 'versionCode', 'bundleVersion'])
+
+tiappCache = {}
+
+def localName(tag):
+	return tag.rsplit('}', 1)[-1]
+
+def parseTiApp(path):
+	# stream the file and stop as soon as every field we care about was seen
+	values = dict.fromkeys(TiApp._fields)
+	stack = []
+	bundleVersionKey = False
+	for event, elem in ElementTree.iterparse(path, events=('start', 'end')):
+		name = localName(elem.tag)
+		if event == 'start':
+			stack.append(name)
+			if name == 'manifest' and 'android' in stack:
+				for attr, value in elem.attrib.items():
+					if localName(attr) == 'versionCode':
+						values['versionCode'] = value
+			continue
+		stack.pop()
+		text = (elem.text or '').strip()
+		if len(stack) == 1:
+			if name == 'sdk-version':
+				values['sdkVersion'] = text
+			elif name in ('id', 'version'):
+				values[name] = text
+		elif 'ios' in stack and 'plist' in stack:
+			if bundleVersionKey and name == 'string':
+				values['bundleVersion'] = text
+			bundleVersionKey = (name == 'key' and text == 'CFBundleVersion')
+		if None not in values.values():
+			break
+	return TiApp(**values)
+
+def readTiApp(path):
+	# memoized per file mtime, returns None when the file is missing or not valid xml
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+	key = (stat.st_mtime, stat.st_size)
+	cached = tiappCache.get(path)
+	if cached is not None and cached[0] == key:
+		return cached[1]
+	try:
+		tiapp = parseTiApp(path)
+	except ElementTree.ParseError as e:
+		print("could not parse " + path + ": " + str(e))
+		tiapp = None
+	tiappCache[path] = (key, tiapp)
+	return tiapp
+
+BUILD_NUMBER_PATTERNS = {
+	'ios': re.compile(r'(<key>CFBundleVersion</key>\s*<string>)(\d+)(</string>)'),
+	'android': re.compile(r'(android:versionCode=")(\d+)(")')
+}
+
+def bumpBuildNumbers(tiappPath, ios=False, android=False, dryRun=False):
+	# one read-modify-write for every requested platform, returns the new numbers per platform
+	with open(tiappPath, encoding='utf-8', mode='r', newline='') as f:
+		tiapp = f.read()
+	numbers = {}
+	for platform, enabled in (('ios', ios), ('android', android)):
+		if not enabled:
+			continue
+		def replace(m):
+			if platform not in numbers:
+				numbers[platform] = int(m.group(2)) + 1
+			return m.group(1) + str(numbers[platform]) + m.group(3)
+		tiapp = BUILD_NUMBER_PATTERNS[platform].sub(replace, tiapp)
+	if numbers and not dryRun:
+		print('updating tiapp build numbers to ' + str(numbers))
+		writeFileAtomic(tiappPath, tiapp)
+	return numbers
+
+#--------------------------------------------------------------
+# PROJECT INDEX
+#--------------------------------------------------------------
+
+def listFolder(folder):
+	# [(name, path, isDir)], symlinked folders are not followed
+	if hasattr(os, 'scandir'):
+		return [(entry.name, entry.path, entry.is_dir(follow_symlinks=False)) for entry in os.scandir(folder)]
+	entries = []
+	for name in os.listdir(folder):
+		path = os.path.join(folder, name)
+		entries.append((name, path, os.path.isdir(path) and not os.path.islink(path)))
+	return entries
+
+def scanProjects(root, maxDepth, ignores):
+	# every folder under root holding a tiapp.xml, projects are not searched for nested projects
+	projects = []
+	pending = [(root, 0)]
+	while pending:
+		folder, depth = pending.pop()
+		try:
+			entries = listFolder(folder)
+		except OSError:
+			continue
+		if any(name == "tiapp.xml" and not isDir for name, path, isDir in entries):
+			projects.append(folder)
+			continue
+		if depth >= maxDepth:
+			continue
+		for name, path, isDir in entries:
+			if isDir and not any(fnmatch.fnmatch(name, pattern) for pattern in ignores):
+				pending.append((path, depth + 1))
+	return sorted(projects)
+
+def rankProjects(projects):
+	# most recently built first, the others by path
+	lastRun = {}
+	for entry in history.recent(projects):
+		lastRun[entry["project"]] = max(lastRun.get(entry["project"], 0), entry.get("lastRun", 0))
+	return sorted(projects, key=lambda project: (-lastRun.get(project, 0), project.lower()))
+
+class ProjectIndex(object):
+
+	# Titanium projects below the folders of every window, each folder scanned once on scanExecutor
+	def __init__(self):
+		self.windows = {}
+		self.lock = threading.Lock()
+
+	def sync(self, window):
+		# scans folders added to the window, forgets the removed ones
+		folders = window.folders()
+		maxDepth = int(get_setting("projectScanDepth", 4))
+		ignores = list(get_setting("projectIgnores", [".*", "node_modules", "build", "dist"]))
+		with self.lock:
+			roots = self.windows.setdefault(window.id(), {})
+			for root in [root for root in roots if root not in folders]:
+				del roots[root]
+			for root in folders:
+				if root not in roots:
+					roots[root] = scanExecutor.submit(scanProjects, root, maxDepth, ignores)
+			return dict(roots)
+
+	def projects(self, window):
+		# what is known right now, without waiting for running scans
+		projects = []
+		with self.lock:
+			futures = list(self.windows.get(window.id(), {}).values())
+		for future in futures:
+			if future.done() and future.exception() is None:
+				projects.extend(project for project in future.result() if os.path.isfile(os.path.join(project, "tiapp.xml")))
+		return projects
+
+	def whenReady(self, window, callback):
+		# callback(projects) on the main thread once every folder of the window was scanned
+		futures = list(self.sync(window).values())
+		called = []
+		def check(future):
+			if not called and all(f.done() for f in futures):
+				called.append(True)
+				callback(self.projects(window))
+		if not futures:
+			sublime.set_timeout(lambda: callback([]), 0)
+		for future in futures:
+			whenDone(future, check)
+
+	def added(self, window, project):
+		# a tiapp.xml was created, add its folder without scanning again
+		with self.lock:
+			for root, future in self.windows.get(window.id(), {}).items():
+				if future.done() and future.exception() is None and (project + os.sep).startswith(root + os.sep):
+					if project not in future.result():
+						future.result().append(project)
+						future.result().sort()
+
+	def forget(self, window=None):
+		with self.lock:
+			if window is None:
+				self.windows.clear()
+			else:
+				self.windows.pop(window.id(), None)
+
+projectIndex = ProjectIndex()
+
+#--------------------------------------------------------------
+# ARTIFACT CACHE
+#--------------------------------------------------------------
+
+# project folders whose content goes into a build, Resources is generated from app/ in Alloy projects
+FINGERPRINT_FOLDERS = ("app", "Resources", "modules", "platform", "i18n")
+ARTIFACT_EXTENSIONS = {"android": (".apk", ".aab"), "ios": (".ipa",)}
+
+def inputFiles(projectDir):
+	alloy = os.path.isdir(os.path.join(projectDir, "app"))
+	files = []
+	for folder in FINGERPRINT_FOLDERS:
+		if folder == "Resources" and alloy:
+			continue
+		for root, dirs, names in os.walk(os.path.join(projectDir, folder)):
+			dirs[:] = [name for name in dirs if not name.startswith('.')]
+			files.extend(os.path.join(root, name) for name in names if not name.startswith('.'))
+	return files
+
+def projectFingerprint(projectDir, platform, sdk, identity):
+	# only files whose mtime or size changed since the last fingerprint are read again, in parallel
+	cachePath = os.path.join(CACHE_FOLDER, "fingerprints", hashlib.sha1(projectDir.encode('utf-8')).hexdigest()[:12] + ".json")
+	cached = readJSONFile(cachePath, {})
+	stats = {}
+	for path in inputFiles(projectDir):
+		try:
+			stat = os.stat(path)
+		except OSError:
+			continue
+		stats[os.path.relpath(path, projectDir)] = [stat.st_mtime, stat.st_size]
+	stale = [name for name, stat in stats.items() if cached.get(name, [])[:2] != stat]
+	if stale:
+		with ThreadPoolExecutor(max_workers=4) as pool:
+			for name, digest in zip(stale, pool.map(lambda name: fileDigest(os.path.join(projectDir, name)), stale)):
+				cached[name] = stats[name] + [digest]
+	digests = dict((name, cached[name]) for name in stats)
+	if stale or len(digests) != len(cached):
+		writeJSONFile(cachePath, digests)
+	# the build numbers are bumped by every dist build, they are not an input
+	with open(os.path.join(projectDir, "tiapp.xml"), encoding='utf-8', mode='r', newline='') as f:
+		tiapp = f.read()
+	for pattern in BUILD_NUMBER_PATTERNS.values():
+		tiapp = pattern.sub(r'\g<1>\g<3>', tiapp)
+	inputs = [platform, sdk, identity, tiapp, sorted((name, entry[2]) for name, entry in digests.items())]
+	return hashlib.sha1(json.dumps(inputs).encode('utf-8')).hexdigest()
+
+def artifactPaths(outputDir, platform):
+	if not os.path.isdir(outputDir):
+		return []
+	return [os.path.join(outputDir, name) for name in sorted(os.listdir(outputDir)) if name.endswith(ARTIFACT_EXTENSIONS[platform])]
+
+def findArtifact(outputDir, platform, fingerprint):
+	# an artifact built from the same inputs that was not touched since
+	for path in artifactPaths(outputDir, platform):
+		record = readJSONFile(path + ".fingerprint")
+		if record and record.get('fingerprint') == fingerprint and record.get('mtime') == os.path.getmtime(path):
+			return path
+	return None
+
+def recordArtifacts(outputDir, platform, fingerprint, since):
+	# <artifact>.fingerprint next to every artifact written by the build started at since
+	for path in artifactPaths(outputDir, platform):
+		stat = os.stat(path)
+		if stat.st_mtime >= since - 1:
+			writeJSONFile(path + ".fingerprint", {'fingerprint': fingerprint, 'mtime': stat.st_mtime, 'size': stat.st_size})
+
+#--------------------------------------------------------------
+# CLEAN
+#--------------------------------------------------------------
+
+# platform -> (build output folders, folders generated by Alloy), relative to the project
+CLEAN_TARGETS = collections.OrderedDict([
+	("ios", (["build/iphone"], ["Resources/iphone", "Resources/ios"])),
+	("android", (["build/android"], ["Resources/android"])),
+	("mobileweb", (["build/mobileweb"], ["Resources/mobileweb"]))
+])
+DELETING_SUFFIX = ".deleting-"
+
+def cleanTargets(projectDir, platform):
+	# existing folders the clean of one platform, or "all", removes. Resources/<platform> is only
+	# generated in Alloy projects, classic projects keep their own assets there
+	alloy = os.path.isdir(os.path.join(projectDir, "app"))
+	folders = ["build"] if platform == "all" else []
+	for name, (build, generated) in CLEAN_TARGETS.items():
+		if platform == name:
+			folders.extend(build)
+		if platform in ("all", name) and alloy:
+			folders.extend(generated)
+	paths = [os.path.join(projectDir, folder) for folder in folders]
+	# leftovers of an interrupted background clean
+	for parent in (projectDir, os.path.join(projectDir, "build"), os.path.join(projectDir, "Resources")):
+		if os.path.isdir(parent):
+			paths.extend(os.path.join(parent, name) for name in os.listdir(parent) if name.startswith('.') and DELETING_SUFFIX in name)
+	return [path for path in paths if os.path.lexists(path)]
+
+def detachFolders(projectDir, folders):
+	# rename them to hidden folders of the project root, a build can start right away while they are
+	# deleted. Never left inside Resources/, which the build copies. A folder that cannot be renamed
+	# is deleted in place
+	detached = []
+	for folder in folders:
+		if DELETING_SUFFIX in os.path.basename(folder):
+			detached.append(folder)
+			continue
+		name = os.path.relpath(folder, projectDir).replace(os.sep, '-')
+		trash = os.path.join(projectDir, "." + name + DELETING_SUFFIX + uuid.uuid4().hex[:8])
+		try:
+			os.rename(folder, trash)
+			detached.append(trash)
+		except OSError as e:
+			print("Titanium: could not move " + folder + " away, deleting it in place: " + str(e))
+			detached.append(folder)
+	return detached
+
+def removeEntry(remove, path):
+	# entries removed by someone else meanwhile (Alloy, the CLI) are fine
+	try:
+		remove(path)
+	except FileNotFoundError:
+		pass
+
+def removeTree(path):
+	# bottom up delete, returns the bytes freed
+	try:
+		if os.path.islink(path) or not os.path.isdir(path):
+			size = os.lstat(path).st_size
+			os.remove(path)
+			return size
+	except FileNotFoundError:
+		return 0
+	freed = 0
+	for root, dirs, files in os.walk(path, topdown=False):
+		for name in files:
+			filePath = os.path.join(root, name)
+			try:
+				freed += os.lstat(filePath).st_size
+			except FileNotFoundError:
+				continue
+			removeEntry(os.remove, filePath)
+		for name in dirs:
+			dirPath = os.path.join(root, name)
+			removeEntry(os.remove if os.path.islink(dirPath) else os.rmdir, dirPath)
+	removeEntry(os.rmdir, path)
+	return freed
+
+def removeFolders(folders):
+	# the entries of every folder are deleted concurrently, then the emptied folders
+	entries = []
+	for folder in folders:
+		if os.path.isdir(folder) and not os.path.islink(folder):
+			try:
+				entries.extend(os.path.join(folder, name) for name in os.listdir(folder))
+			except FileNotFoundError:
+				pass
+	freed = 0
+	if entries:
+		with ThreadPoolExecutor(max_workers=8) as pool:
+			freed = sum(pool.map(removeTree, entries))
+	for folder in folders:
+		freed += removeTree(folder)
+	return freed
+
+def formatSize(size):
+	for unit in ("bytes", "KB", "MB"):
+		if size < 1024:
+			return ("%d " if unit == "bytes" else "%.1f ") % size + unit
+		size /= 1024.0
+	return "%.1f GB" % size
+
+#--------------------------------------------------------------
+# BACKGROUND PREFETCH
+#--------------------------------------------------------------
+
+prefetched = {}
+prefetchLock = threading.Lock()
+
+def projectSdkVersion(node, cli, projectDir):
+	with timed(projectDir, "sdk-version"):
+		tiapp = readTiApp(os.path.join(projectDir, "tiapp.xml"))
+		if tiapp is not None and tiapp.sdkVersion:
+			return tiapp.sdkVersion
+		# unusual layout, let the CLI figure it out
+		cmd = [node, cli, "project", "sdk-version", "--project-dir", projectDir, "--log-level", "error", "--output", "json"]
+		result = runCli(cmd, "sdk-version")
+		info = json.loads(result.decode('utf-8'))
+		print(info)
+		return info
+
+def isPrefetchFresh(projectDir):
+	with prefetchLock:
+		entry = prefetched.get(projectDir)
+		return entry is not None and (not entry['sdk'].done() or time.time() - entry['time'] < PREFETCH_TTL)
+
+def prefetchProject(node, cli, projectDir):
+	# start the slow CLI queries on worker threads, results are shared by every command on the project
+	with prefetchLock:
+		entry = prefetched.get(projectDir)
+		if entry is not None and (not entry['sdk'].done() or time.time() - entry['time'] < PREFETCH_TTL):
+			return entry
+		entry = {'time': time.time()}
+		entry['sdk'] = executor.submit(projectSdkVersion, node, cli, projectDir)
+		def infoFor(platform):
+			return fetchInfo(node, cli, entry['sdk'].result(), projectDir, platform)
+		entry['infoFor'] = infoFor
+		entry['android'] = executor.submit(infoFor, "android")
+		if sublime.platform() == "osx":
+			entry['ios'] = executor.submit(infoFor, "ios")
+			# warms the index the profile picker checks against
+			entry['profiles'] = executor.submit(profileIndex.scan, [PROVISIONING_PROFILES_DIR])
+		prefetched[projectDir] = entry
+		return entry
+
+def forgetPrefetch(projectDir=None):
+	with prefetchLock:
+		if projectDir is None:
+			prefetched.clear()
+		elif projectDir in prefetched:
+			del prefetched[projectDir]
+
+def whenDone(future, callback):
+	# the callback always runs on the main thread
+	future.add_done_callback(lambda f: sublime.set_timeout(lambda: callback(f), 0))
+
+#--------------------------------------------------------------
+# FONTELLO
+#--------------------------------------------------------------
+
+class FontelloClient(object):
+
+	def __init__(self, host=FONTELLO_HOST, timeout=60):
+		self.host = host.rstrip('/')
+		self.timeout = timeout
+
+	def createSession(self, config):
+		# same multipart upload as the fontello web form, answers with the session id
+		boundary = uuid.uuid4().hex.encode('ascii')
+		body = b''.join([
+			b'--', boundary, b'\r\n',
+			b'Content-Disposition: form-data; name="config"; filename="config.json"\r\n',
+			b'Content-Type: application/json\r\n\r\n',
+			config, b'\r\n--', boundary, b'--\r\n'
+		])
+		request = Request(self.host, data=body, headers={
+			'Content-Type': 'multipart/form-data; boundary=' + boundary.decode('ascii'),
+			'Accept': 'application/json'
+		})
+		with contextlib.closing(urlopen(request, timeout=self.timeout)) as response:
+			return response.read().decode('utf-8').strip()
+
+	def sessionUrl(self, sessionId):
+		return self.host + '/' + sessionId
+
+	def isSessionValid(self, sessionId):
+		try:
+			with contextlib.closing(urlopen(self.sessionUrl(sessionId), timeout=self.timeout)) as response:
+				return response.getcode() == 200
+		except IOError:
+			return False
+
+	def download(self, sessionId):
+		# small archives stay in memory, a unique temp file takes over past MAX_FONTELLO_BUFFER.
+		# not a SpooledTemporaryFile, ZipFile needs seekable() which it only has since python 3.11
+		archive = BytesIO()
+		try:
+			with contextlib.closing(urlopen(self.sessionUrl(sessionId) + '/get', timeout=self.timeout)) as response:
+				for chunk in iter(lambda: response.read(65536), b''):
+					if isinstance(archive, BytesIO) and archive.tell() + len(chunk) > MAX_FONTELLO_BUFFER:
+						spill = tempfile.TemporaryFile()
+						spill.write(archive.getvalue())
+						archive = spill
+					archive.write(chunk)
+		except:
+			archive.close()
+			raise
+		archive.seek(0)
+		return archive
+
+	def extract(self, archive, extras=False):
+		# one pass over the central directory, returns {'config': bytes, 'ttf': bytes, 'css/x.css': bytes, ...}
+		files = {}
+		with ZipFile(archive) as zipfile:
+			for info in zipfile.infolist():
+				parts = info.filename.split('/')
+				if parts[-1] == 'config.json':
+					files['config'] = zipfile.read(info)
+				elif len(parts) > 1 and parts[-2] == 'font' and parts[-1].endswith('.ttf'):
+					files['ttf'] = zipfile.read(info)
+				elif extras and len(parts) > 1 and parts[-1].endswith(('.css', '.svg')):
+					files[parts[-2] + '/' + parts[-1]] = zipfile.read(info)
+		return files
+
+class FontelloSessions(object):
+
+	# fontello sessions shared by every window, keyed by the hash of the uploaded config
+	def __init__(self, path):
+		self.path = path
+		self.sessions = None
+		self.lock = threading.Lock()
+
+	def load(self):
+		if self.sessions is None:
+			self.sessions = readJSONFile(self.path, {})
+		return self.sessions
+
+	def lookup(self, config, client=None):
+		# a still valid session id for this config content, or None
+		key = hashlib.sha1(config).hexdigest()
+		expiry = float(get_setting("fontelloSessionExpiry", 20)) * 3600
+		with self.lock:
+			entry = self.load().get(key)
+		if entry is None or time.time() - entry['time'] > expiry:
+			return None
+		if client is not None and get_setting("fontelloValidateSessions", False) and not client.isSessionValid(entry['session']):
+			return None
+		return entry['session']
+
+	def remember(self, config, sessionId):
+		with self.lock:
+			sessions = self.load()
+			expiry = float(get_setting("fontelloSessionExpiry", 20)) * 3600
+			for key in [key for key, entry in sessions.items() if time.time() - entry['time'] > expiry]:
+				del sessions[key]
+			sessions[hashlib.sha1(config).hexdigest()] = {'session': sessionId, 'time': time.time()}
+			try:
+				writeJSONFile(self.path, sessions)
+			except OSError as e:
+				print("Titanium: could not cache the fontello session: " + str(e))
+
+	def get(self, config, client, projectDir=None):
+		sessionId = self.lookup(config, client)
+		if sessionId is None:
+			with timed(projectDir, "fontello upload") if projectDir else contextlib.ExitStack():
+				sessionId = client.createSession(config)
+			self.remember(config, sessionId)
+		return sessionId
+
+fontelloSessions = FontelloSessions(os.path.join(CACHE_FOLDER, "fontello_sessions.json"))
+
+def buildFontelloFont(projectDir, fontConfigFile, fontelloSessionId, client=None, extras=False):
+	client = client or FontelloClient()
+	with timed(projectDir, "fontello download"):
+		archive = client.download(fontelloSessionId)
+	with archive:
+		files = client.extract(archive, extras)
+	if 'config' not in files:
+		raise IOError("no config.json in the fontello archive of " + fontConfigFile)
+	writeIfChanged(os.path.join(projectDir, fontConfigFile), files['config'])
+	# the session now holds exactly the downloaded config
+	fontelloSessions.remember(files['config'], fontelloSessionId)
+	configJSON = json.loads(files['config'].decode('utf-8'))
+	fontName = configJSON["name"]
+	fontsDir = os.path.join(projectDir, "Resources", "fonts")
+	generateIconicFont(projectDir, configJSON, fontName)
+	if 'ttf' in files:
+		writeIfChanged(os.path.join(fontsDir, fontName + ".ttf"), files['ttf'])
+	for name, data in files.items():
+		if '/' in name:
+			writeIfChanged(os.path.join(projectDir, "fontello", fontName, name), data)
+	return fontName
+
+def fontelloConfigFiles(projectDir):
+	return sorted(f for f in os.listdir(projectDir) if re.match(r'fontello_.*\.json', f))
+
+def fontelloStatePath(projectDir):
+	return os.path.join(CACHE_FOLDER, "fontello", hashlib.sha1(projectDir.encode('utf-8')).hexdigest()[:12] + ".json")
+
+def buildAllFontelloFonts(projectDir, client=None, extras=False, force=False):
+	# rebuild every fontello_*.json whose content changed since its last build, in parallel
+	client = client or FontelloClient()
+	statePath = fontelloStatePath(projectDir)
+	state = readJSONFile(statePath, {})
+	fontsDir = os.path.join(projectDir, "Resources", "fonts")
+	def build(configFile):
+		configPath = os.path.join(projectDir, configFile)
+		previous = state.get(configFile)
+		if not force and previous is not None and previous['hash'] == fileDigest(configPath) \
+				and os.path.isfile(os.path.join(fontsDir, previous['font'] + ".ttf")):
+			return None
+		with open(configPath, mode='rb') as f:
+			config = f.read()
+		sessionId = fontelloSessions.get(config, client, projectDir)
+		fontName = buildFontelloFont(projectDir, configFile, sessionId, client, extras)
+		return {'hash': fileDigest(configPath), 'font': fontName}
+	summary = {'built': [], 'skipped': [], 'failed': []}
+	configFiles = fontelloConfigFiles(projectDir)
+	pool = ThreadPoolExecutor(max_workers=4)
+	try:
+		for configFile, future in [(configFile, pool.submit(build, configFile)) for configFile in configFiles]:
+			try:
+				result = future.result()
+			except Exception as e:
+				print("could not build " + configFile + ": " + str(e))
+				summary['failed'].append(configFile)
+				continue
+			if result is None:
+				summary['skipped'].append(configFile)
+			else:
+				state[configFile] = result
+				summary['built'].append(configFile)
+	finally:
+		pool.shutdown(wait=False)
+	writeJSONFile(statePath, state)
+	return summary
+
+def iconicFontModule(configJSON, fontName, compact=False):
+	# glyphs are sorted by name so that the same config always gives the same bytes
+	glyphs = sorted((glyph["css"], glyph["code"]) for glyph in configJSON.get("glyphs", []) if glyph.get("selected", True) == True)
+	if compact:
+		# array backed table, the name -> code map is built once when the module loads
+		lines = [
+			"var names = [" + ", ".join("'" + css + "'" for css, code in glyphs) + "];",
+			"var codes = [" + ", ".join(hex(code) for css, code in glyphs) + "];",
+			"var charcode = {};",
+			"for (var i = 0; i < names.length; i++) {\n\tcharcode[names[i]] = codes[i];\n}",
+			"function Font(options) {\n\tthis.fontfamily = '" + fontName + "';\n}",
+			"Font.names = names;",
+			"Font.codes = codes;",
+			"Font.prototype.charcode = charcode;"
+		]
+	else:
+		lines = ["function Font(options) {\n\tthis.fontfamily = '" + fontName + "';\n\tthis.charcode = {"]
+		lines.extend("\t\t'" + css + "': " + hex(code) + "," for css, code in glyphs)
+		lines.append("\t};\n}")
+	lines.append("Font.prototype.getCharcode = function(options) {\n\treturn this.charcode[options];\n};\nmodule.exports = Font;")
+	return "\n".join(lines)
+
+def generateIconicFont(projectDir, configJSON, fontName):
+	fileContent = iconicFontModule(configJSON, fontName, get_setting("fontelloCompactModule", False))
+	return writeIfChanged(os.path.join(projectDir, "Resources", "fonts", "font_" + fontName + ".js"), fileContent)
+
+#--------------------------------------------------------------
+# BUILD HISTORY
+#--------------------------------------------------------------
+
+# options whose values are never written to disk, they are read from the settings again on replay
+SECRET_OPTIONS = {"--store-password": "android.store-password", "--key-password": "android.key-password"}
+
+class HistoryStore(object):
+
+	def __init__(self, path):
+		self.path = path
+		self.entries = None
+		self.lock = threading.RLock()
+
+	def load(self):
+		# most recent first, keyed by the hash of (project, platform, target, options)
+		if self.entries is None:
+			self.entries = collections.OrderedDict()
+			for entry in readJSONFile(self.path, {}).get("entries", []):
+				self.entries[entry["key"]] = entry
+		return self.entries
+
+	def save(self):
+		# a history that cannot be written must not keep the build from starting
+		try:
+			writeJSONFile(self.path, {"entries": list(self.entries.values())})
+		except OSError as e:
+			print("Titanium: could not save the build history: " + str(e))
+
+	def redact(self, args):
+		args = list(args)
+		for i, arg in enumerate(args[:-1]):
+			if arg in SECRET_OPTIONS:
+				args[i + 1] = "*****"
+		return args
+
+	def commandFor(self, entry):
+		cmd = list(entry["cmd"])
+		for i, arg in enumerate(cmd[:-1]):
+			if arg in SECRET_OPTIONS:
+				cmd[i + 1] = get_setting(SECRET_OPTIONS[arg], "")
+		return cmd
+
+	def record(self, project, platform, target, options, cmd):
+		options = self.redact(options)
+		key = hashlib.sha1(json.dumps([project, platform, target, options]).encode('utf-8')).hexdigest()
+		with self.lock:
+			entries = self.load()
+			entry = entries.pop(key, None) or {"key": key, "project": project, "platform": platform, "target": target, "options": options, "runs": 0, "lastDuration": None}
+			entry["cmd"] = self.redact(cmd)
+			entries[key] = entry
+			entries.move_to_end(key, last=False)
+			self.evict(project)
+			self.touch(key)
+			return entry
+
+	def touch(self, key):
+		with self.lock:
+			entry = self.load()[key]
+			entry["runs"] += 1
+			entry["lastRun"] = time.time()
+			self.entries.move_to_end(key, last=False)
+			self.save()
+
+	def evict(self, project):
+		limit = max(1, int(get_setting("historySize", 10)))
+		keys = [key for key, entry in self.entries.items() if entry["project"] == project]
+		for key in keys[limit:]:
+			del self.entries[key]
+
+	def setDuration(self, key, duration, returncode):
+		with self.lock:
+			entry = self.load().get(key)
+			if entry is not None:
+				entry["lastDuration"] = duration
+				entry["lastReturnCode"] = returncode
+				self.save()
+
+	def get(self, key):
+		with self.lock:
+			return self.load().get(key)
+
+	def recent(self, projects=None):
+		with self.lock:
+			return [entry for entry in self.load().values() if projects is None or entry["project"] in projects]
+
+history = HistoryStore(os.path.join(CACHE_FOLDER, "history.json"))
+
+#--------------------------------------------------------------
+# BUILD PROCESSES
+#--------------------------------------------------------------
+
+buildProcesses = {}
+
+class BuildProcess(object):
+
+	def __init__(self, window, name, cmd):
+		self.window = window
+		self.name = name
+		self.cmd = cmd
+		self.returncode = None
+		self.duration = None
+		self.process = None
+		self.killed = False
+		# [line, level, file, row, col, message], newest last
+		self.diagnostics = collections.deque(maxlen=MAX_DIAGNOSTICS)
+		self.current = -1
+		self.lookahead = 0
+		self.lineCount = 0
+		self.trimmed = 0
+		self.pendingLine = ''
+		self.phases = []
+		self.maxLines = int(get_setting("maxOutputLines", 20000))
+		self.spillPath = None
+		if get_setting("spillBuildLog", False):
+			self.spillPath = os.path.join(CACHE_FOLDER, "logs", name + ".log")
+		self.panel = window.create_output_panel(name)
+		self.panel.settings().set("word_wrap", False)
+		self.panel.set_read_only(True)
+		self.onDone = []
+		buildProcesses[(window.id(), name)] = self
+
+	def replaced(self):
+		# a newer build of the same name owns the panel now
+		return buildProcesses.get((self.window.id(), self.name)) is not self
+
+	def append(self, text):
+		if not self.replaced():
+			self.panel.run_command('append', {'characters': text, 'force': True, 'scroll_to_end': True})
+
+	def parse(self, text):
+		lines = (self.pendingLine + text).split('\n')
+		self.pendingLine = lines.pop()
+		for line in lines:
+			self.parse_line(line, self.lineCount)
+			self.lineCount += 1
+
+	def parse_line(self, line, lineNo):
+		if line.startswith("[INFO]"):
+			phase = PHASE_PATTERN.match(line)
+			if phase is not None and (not self.phases or self.phases[-1][0] != phase.group(1)):
+				self.phases.append([phase.group(1), time.time()])
+		level = LEVEL_PATTERN.search(line)
+		if level is not None:
+			self.diagnostics.append([lineNo, level.group(1), None, 0, 0, line.strip()])
+			self.lookahead = 5
+		elif self.lookahead > 0:
+			self.lookahead -= 1
+		else:
+			return
+		# the location is either on the error line or in the few lines following it
+		diagnostic = self.diagnostics[-1]
+		if diagnostic[2] is None:
+			m = FILE_PATTERN.search(line)
+			if m is not None:
+				diagnostic[2:5] = [m.group(1), int(m.group(2) or 0), int(m.group(3) or 0)]
+
+	def trim(self):
+		# keep the panel as a ring buffer of the last maxLines lines
+		retained = self.lineCount - self.trimmed
+		if retained > self.maxLines * 1.1 and not self.replaced():
+			count = retained - self.maxLines
+			self.panel.run_command('titanium_trim_panel', {'lines': count})
+			self.trimmed += count
+
+	def navigate(self, step):
+		if not self.diagnostics:
+			sublime.status_message("Titanium: no errors or warnings")
+			return
+		self.current = (self.current + step) % len(self.diagnostics)
+		lineNo, level, path, row, col, message = self.diagnostics[self.current]
+		if lineNo >= self.trimmed:
+			point = self.panel.text_point(lineNo - self.trimmed, 0)
+			self.panel.sel().clear()
+			self.panel.sel().add(sublime.Region(point))
+			self.panel.show(point)
+		if path is not None:
+			self.window.open_file(path + ":" + str(row) + ":" + str(col), sublime.ENCODED_POSITION)
+		sublime.status_message(message)
+
+	def kill(self):
+		self.killed = True
+		if self.process is not None and self.process.poll() is None:
+			if os.name == 'posix':
+				# gradle, xcodebuild and the like run in the build's process group and go with it
+				try:
+					os.killpg(self.process.pid, signal.SIGTERM)
+				except OSError:
+					pass
+			else:
+				self.process.terminate()
 
-def copyFile(src, dest):
+	def record_timings(self):
+		if "--project-dir" not in self.cmd or "build" not in self.cmd:
+			return
+		durations = {"build": self.duration}
+		ends = [phase[1] for phase in self.phases[1:]] + [self.start + self.duration]
+		for (name, start), end in zip(self.phases, ends):
+			key = "build: " + name.lower()
+			durations[key] = durations.get(key, 0) + end - start
+		recordTimings(self.cmd[self.cmd.index("--project-dir") + 1], durations)
+
+	# blocking, meant to be run on a worker thread
+	def run(self):
+		start = self.start = time.time()
+		if self.killed:
+			# replaced or stopped before it got a worker
+			self.returncode = -1
+			return self
+		self.append(" ".join(self.cmd) + "\n")
+		self.lineCount += 1
+		try:
+			self.process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=os.name == 'posix')
+		except OSError as e:
+			self.append("Error: " + str(e) + "\n")
+			self.returncode = -1
+			return self
+		if self.killed:
+			# kill() ran while the process was starting
+			self.kill()
+		spill = None
+		if self.spillPath is not None:
+			if not os.path.isdir(os.path.dirname(self.spillPath)):
+				os.makedirs(os.path.dirname(self.spillPath))
+			spill = open(self.spillPath, encoding='utf-8', mode='w')
+		decoder = codecs.getincrementaldecoder('utf-8')('replace')
+		fd = self.process.stdout.fileno()
+		try:
+			while True:
+				chunk = os.read(fd, CHUNK_SIZE)
+				if not chunk:
+					break
+				text = decoder.decode(chunk)
+				self.parse(text)
+				self.append(text)
+				if spill is not None:
+					spill.write(text)
+				self.trim()
+		finally:
+			if spill is not None:
+				spill.close()
+		self.parse(decoder.decode(b'', True) + '\n')
+		self.returncode = self.process.wait()
+		self.duration = time.time() - start
+		status = "killed" if self.killed else "exit code %d" % self.returncode
+		self.append("[Finished in %.1fs with %s, %d errors/warnings]\n" % (self.duration, status, len(self.diagnostics)))
+		if self.returncode == 0:
+			self.record_timings()
+		for callback in self.onDone:
+			callback(self)
+		return self
+
+#--------------------------------------------------------------
+# WATCH MODE
+#--------------------------------------------------------------
+
+WATCHED_FOLDERS = ("app", "Resources")
+
+def contentDigest(path):
 	try:
-		print ("copying " + src + " to " +  dest)
-		shutil.copy2(src, dest)
-	# eg. src and dest are the same file
-	except shutil.Error as e:
-		print('Error: %s' % e)
-	# eg. source or destination doesn't exist
-	except IOError as e:
-		print('Error: %s' % e.strerror)
+		return fileDigest(path)
+	except (IOError, OSError):
+		return None
+
+class BuildWatcher(object):
+
+	# re-runs the last build of a project once a burst of saves below app/ or Resources/ changed some content
+	def __init__(self):
+		self.windows = {}
+		# project -> path -> digest of the content last seen on disk
+		self.digests = {}
+		self.changed = {}
+		self.generations = {}
+
+	def enabled(self, window):
+		return self.windows.get(window.id(), get_setting("watchMode", False))
+
+	def toggle(self, window):
+		enabled = self.windows[window.id()] = not self.enabled(window)
+		if enabled:
+			for view in window.views():
+				self.track(view)
+		else:
+			for project in self.projects(window):
+				self.digests.pop(project, None)
+				self.changed.pop(project, None)
+		return enabled
+
+	def projects(self, window):
+		return projectIndex.projects(window) + [folder for folder in window.folders() if os.path.isfile(os.path.join(folder, "tiapp.xml"))]
+
+	def projectFor(self, window, path):
+		for project in self.projects(window):
+			for folder in WATCHED_FOLDERS:
+				if path.startswith(os.path.join(project, folder) + os.sep):
+					return project
+		return None
+
+	def track(self, view):
+		# a clean buffer matches the file on disk, its digest is the baseline of the first save
+		window, path = view.window(), view.file_name()
+		if window is None or not path or view.is_dirty() or not self.enabled(window):
+			return
+		project = self.projectFor(window, path)
+		if project is None or path in self.digests.get(project, {}):
+			return
+		runInBackground(lambda: contentDigest(path), lambda digest: self.digests.setdefault(project, {}).setdefault(path, digest))
+
+	def saved(self, window, path):
+		if not self.enabled(window):
+			return
+		project = self.projectFor(window, path)
+		if project is None:
+			return
+		self.changed.setdefault(project, set()).add(path)
+		generation = self.generations[project] = self.generations.get(project, 0) + 1
+		delay = int(float(get_setting("watchDebounce", 0.5)) * 1000)
+		sublime.set_timeout(lambda: self.flush(window, project, generation), delay)
+
+	def flush(self, window, project, generation):
+		# a newer save restarted the delay, that one takes the whole burst
+		if self.generations.get(project) != generation or not self.enabled(window):
+			return
+		paths = list(self.changed.pop(project, ()))
+		runInBackground(lambda: [(path, contentDigest(path)) for path in paths], lambda digests: self.rebuild(window, project, digests))
+
+	def rebuild(self, window, project, digests):
+		known = self.digests.setdefault(project, {})
+		changed = [path for path, digest in digests if digest != known.get(path)]
+		known.update(digests)
+		if not changed:
+			sublime.status_message("Titanium: no content changed in " + os.path.basename(project))
+			return
+		entries = history.recent([project])
+		if not entries:
+			sublime.status_message("Titanium: build " + os.path.basename(project) + " once to start watching it")
+			return
+		entry = entries[0]
+		history.touch(entry['key'])
+		sublime.status_message("Titanium: " + os.path.basename(changed[0]) + (" and %d more" % (len(changed) - 1) if len(changed) > 1 else "") + " changed, rebuilding")
+		# a build still running for the previous change is killed by the new one
+		cmd = history.commandFor(entry)
+		if get_setting("useStockExec", False):
+			window.run_command("exec", {"cmd": cmd, "file_regex": FILE_REGEX})
+		else:
+			window.run_command("titanium_exec", {"cmd": cmd, "history_key": entry['key']})
+
+buildWatcher = BuildWatcher()
 
 def plugin_loaded():
 	global settings
 	settings = sublime.load_settings(SETTINGS_FILE)
+	settingsResolver.invalidate()
+	settings.add_on_change(SETTINGS_PREFIX + 'resolver', settingsResolver.invalidate)
 
-class TitaniumCommand(sublime_plugin.WindowCommand):
+def plugin_unloaded():
+	settings.clear_on_change(SETTINGS_PREFIX + 'resolver')
+	stopCliDaemons()
 
-	def plistStringFromProvFile(self, path):
-		beginToken = '<?xml'
-		endToken = '</plist>'
-		f = open(path, "rb")
-		data =  str(f.read())
-		f.close()
-		begin = data.find(beginToken)
-		end = data.find(endToken) + len(endToken) 
-		return data[begin:end]
-
-	def getUUIDAndName(self, certPath):
-		plistString = self.plistStringFromProvFile(certPath).replace('\\n', "")
-		plist = plistlib.readPlistFromBytes(bytes(plistString, 'utf-8'))
-		return [plist['UUID'],plist['TeamName'], plist['TeamIdentifier'][0]]
+class TitaniumCommand(sublime_plugin.WindowCommand):
 
 	def copyProvisioningProfile(self, certPath, certName):
-		dest = os.path.join(os.path.expanduser('~/Library/MobileDevice/Provisioning Profiles'), certName + '.mobileprovision')
-		if (not os.path.isfile(dest)):
-			copyFile(certPath, dest)
+		syncProfile(certPath, certName)
 
-	def updateIOsBuildInTiApp(self):
-		#update build number
+	def updateBuildInTiApp(self, ios=False, android=False):
 		tiappPath = os.path.join(self.project_folder, "tiapp.xml")
 		if (os.path.isfile(tiappPath)):
-			f2 = open(tiappPath, encoding='utf-8', mode='r')
-			tiapp = f2.read()
-			f2.close()
-			m = re.search('(?<=<key>CFBundleVersion<\/key>)(\s*<string>)([\d]*)(?=<\/string>)',tiapp)
-			if (m != None):
-				version = int(m.group(2)) + 1
-				print ('updating tiapp CFBundleVersion to ' + str(version))
-				tiapp = re.sub('<key>CFBundleVersion</key>\s*<string>[\d]*</string>', '<key>CFBundleVersion</key><string>' + str(version) + '</string>',tiapp)
-				f2 = open(tiappPath, encoding='utf-8', mode='w')
-				f2.write(tiapp)
-				f2.close()
-		else:
-			print ("tiapp.xml doesnt exist: " + tiappPath)
-
-	def updateAndroidBuildInTiApp(self):
-		#update build number
-		tiappPath = os.path.join(self.project_folder, "tiapp.xml")
-		if (os.path.isfile(tiappPath)):
-			f2 = open(tiappPath, encoding='utf-8', mode='r')
-			tiapp = f2.read()
-			f2.close()
-			m = re.search('(?<=android:versionCode=")([\d]*)(?=")',tiapp)
-			if (m != None):
-				version = int(m.group(1)) + 1
-				print ('updating tiapp android:versionCode to ' + str(version))
-				tiapp = re.sub('(?<=android:versionCode=")[\d]*(?=")', str(version),tiapp)
-				f2 = open(tiappPath, encoding='utf-8', mode='w')
-				f2.write(tiapp)
-				f2.close()
+			return bumpBuildNumbers(tiappPath, ios=ios, android=android)
 		else:
 			print ("tiapp.xml doesnt exist: " + tiappPath)
 
@@ -142,21 +1977,30 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		sublime.active_window().run_command("show_panel", {"panel": "console", "toggle": True})
 
 
-	def runWindowCommand(self, cmd):
-		self.window.run_command("exec", {"cmd": cmd, "file_regex":FILE_REGEX})
+	def runWindowCommand(self, cmd, historyKey=None, artifact=None):
+		if get_setting("useStockExec", False):
+			self.window.run_command("exec", {"cmd": cmd, "file_regex":FILE_REGEX})
+		else:
+			self.window.run_command("titanium_exec", {"cmd": cmd, "history_key": historyKey, "artifact": artifact})
+
+	def most_recent(self):
+		key = sessionSetting('titaniumMostRecent')
+		entry = history.get(key) if key else None
+		if entry is None:
+			recents = history.recent(self.window.folders() + projectIndex.projects(self.window))
+			if recents:
+				entry = recents[0]
+		return entry
+
+	def run_history_entry(self, entry):
+		sessionSetting('titaniumMostRecent', entry['key'])
+		history.touch(entry['key'])
+		self.runWindowCommand(history.commandFor(entry), entry['key'])
 
 	def select_most_recent_command(self, select):
 		if select < 0:
 			return
-
-		titaniumMostRecents = sessionSetting('titaniumMostRecents')
-		titaniumMostRecent = sessionSetting('titaniumMostRecent')
-		recent = titaniumMostRecents[select]
-		titaniumMostRecent = recent[-1]
-		sessionSetting('titaniumMostRecent', titaniumMostRecent)
-		titaniumMostRecents.remove(recent)
-		titaniumMostRecents.appendleft(recent)
-		self.runWindowCommand(titaniumMostRecent)
+		self.run_history_entry(self.recents[select])
 
 
 	def runProjectCommand(self):
@@ -167,10 +2011,31 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 				self.window.run_command("build")
 			return
 		if self.command == 'clean':
-			self.runWindowCommand([self.node, self.cli, "clean", "--no-colors", "--project-dir", self.project_folder])
+			self.pick_clean()
 		else:
-			self.project_sdk = self.get_project_sdk_version()
-			self.pick_platform()
+			self.prefetched = prefetchProject(self.node, self.cli, self.project_folder)
+			self.with_result('sdk', self.on_project_sdk)
+
+	def on_project_sdk(self, sdk):
+		self.project_sdk = sdk
+		self.pick_platform()
+
+	# call back with a prefetched result, without blocking the UI thread when it is still running
+	def with_result(self, name, callback):
+		if name not in self.prefetched:
+			self.prefetched[name] = executor.submit(self.prefetched['infoFor'], name)
+		future = self.prefetched[name]
+		if not future.done():
+			sublime.status_message("Titanium: loading " + name + " info...")
+		def done(f):
+			try:
+				result = f.result()
+			except Exception as e:
+				forgetPrefetch(self.project_folder)
+				self.handleError(e)
+				return
+			callback(result)
+		whenDone(future, done)
 
 
 	def run(self, *args, **kwargs):
@@ -179,23 +2044,26 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		if 'command' in kwargs:
 			self.command = kwargs['command']
 
-		if (sessionHasSetting('titaniumMostRecent') and self.command == 'titaniumMostRecent'):
-			self.runWindowCommand(sessionSetting('titaniumMostRecent'))
+		if (self.command == 'titaniumMostRecent' and self.most_recent() is not None):
+			self.run_history_entry(self.most_recent())
 			return
 
-		titaniumMostRecents = sessionSetting('titaniumMostRecents')
-		print(titaniumMostRecents)
-		if (titaniumMostRecents and 'titaniumMostRecents'  and self.command == 'titaniumMostRecents'):
+		self.recents = history.recent(self.window.folders() + projectIndex.projects(self.window)) or history.recent()
+		if (self.recents and self.command == 'titaniumMostRecents'):
 			cmds = []
-			for project,platform, target, options,cmd in titaniumMostRecents:
-				cmds.append([os.path.basename(project) + ' / ' + platform + ' / ' + target, ' '.join(options)])
+			for entry in self.recents:
+				details = str(entry['runs']) + ' runs'
+				if entry['lastDuration'] is not None:
+					details += ', last %.0fs' % entry['lastDuration']
+				cmds.append([os.path.basename(entry['project']) + ' / ' + entry['platform'] + ' / ' + entry['target'], ' '.join(entry['options']) + '  (' + details + ')'])
 			self.show_quick_panel(cmds, self.select_most_recent_command)
 			return
 
 		folders = self.window.folders()
 		self.node              = get_setting("nodejs", "/usr/local/bin/node")
 		self.cli              = get_setting("titaniumCLI", "/usr/local/bin/titanium")
-		self.android          = get_setting("androidSDK", "/opt/android-sdk") + "/tools/android"
+		self.androidSDK       = get_setting("androidSDK", "/opt/android-sdk")
+		self.android          = self.androidSDK + "/tools/android"
 		self.loggingLevel     = get_setting("loggingLevel", "debug")
 		self.iosVersion       = str(get_setting("iosVersion", "unknown"))
 		self.outputDir       = str(get_setting("outputDir", "release"))
@@ -207,52 +2075,49 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		if len(folders) <= 0:
 			self.show_quick_panel(["ERROR: Must have a project open"], None)
 		else:
-			if len(folders) == 1:
-				self.multipleFolders = False
-				self.project_folder = folders[0]
-				if (os.path.isfile(os.path.join(self.project_folder, "tiapp.xml"))):
-					self.isTitaniumProject = True 
-				self.runProjectCommand()
-				
-			else:
-				self.multipleFolders = True
-				self.pick_project_folder(folders)
+			projectIndex.whenReady(self.window, self.pick_project_folder)
+
+	def pick_project_folder(self, projects):
+		# Titanium projects anywhere in the window, plain folders when there are none
+		self.projectFolders = rankProjects(projects) if projects else self.window.folders()
+		if len(self.projectFolders) == 1:
+			self.multipleFolders = False
+			self.open_project(self.projectFolders[0])
+			return
 
-	def pick_project_folder(self, folders):
+		self.multipleFolders = True
 		folderNames = []
-		for folder in folders:
-			index = folder.rfind('/') + 1
-			if index > 0:
-				folderNames.append(folder[index:])
-			else:
-				folderNames.append(folder)
+		for folder in self.projectFolders:
+			root = max([root for root in self.window.folders() if (folder + os.sep).startswith(root + os.sep)] or [folder], key=len)
+			folderNames.append([os.path.basename(folder), os.path.relpath(folder, os.path.dirname(root))])
 
 		# only show most recent when there is a command stored
-		if sessionHasSetting('titaniumMostRecent'):
-			folderNames.insert(0, 'most recent configuration')
+		self.mostRecent = self.most_recent()
+		if self.mostRecent is not None:
+			folderNames.insert(0, ['most recent configuration', ' '.join([os.path.basename(self.mostRecent['project']), self.mostRecent['platform'], self.mostRecent['target']])])
 
 		self.show_quick_panel(folderNames, self.select_project)
 
 	def select_project(self, select):
-		folders = self.window.folders()
 		if select < 0:
 			return
 
 		# if most recent was an option, we need subtract 1
 		# from the selected index to match the folders array
 		# since the "most recent" option was inserted at the beginning
-		if sessionHasSetting('titaniumMostRecent'):
+		if self.mostRecent is not None:
 			select = select - 1
 
 		if select == -1:
-			self.runWindowCommand(sessionSetting('titaniumMostRecent'))
+			self.run_history_entry(self.mostRecent)
 		else:
-			self.project_folder = folders[select]
-			if (os.path.isfile(os.path.join(self.project_folder, "tiapp.xml"))):
-				self.isTitaniumProject = True 
-			self.runProjectCommand()
-
+			self.open_project(self.projectFolders[select])
 
+	def open_project(self, folder):
+		self.project_folder = folder
+		if (os.path.isfile(os.path.join(self.project_folder, "tiapp.xml"))):
+			self.isTitaniumProject = True 
+		self.runProjectCommand()
 
 	def pick_platform(self):
 		self.preCmd = [self.node, self.cli, "--sdk", self.project_sdk, "--project-dir", self.project_folder]
@@ -260,7 +2125,8 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 
 		# only show most recent when there are NOT multiple top level folders
 		# and there is a command stored
-		if self.multipleFolders == False and 'titaniumMostRecent' in globals():
+		self.mostRecent = self.most_recent()
+		if self.multipleFolders == False and self.mostRecent is not None:
 			self.platforms.insert(0, 'most recent configuration')
 
 		self.show_quick_panel(self.platforms, self.select_platform)
@@ -271,7 +2137,7 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		self.platform = self.platforms[select]
 
 		if self.platform == "most recent configuration":
-			self.runWindowCommand(titaniumMostRecent)
+			self.run_history_entry(self.mostRecent)
 		elif self.platform == "ios":
 			self.targets = ["simulator", "simulator auto", "device", "device-adhoc", "dist-adhoc", "dist-appstore"]
 			self.show_quick_panel(self.targets, self.select_ios_target)
@@ -285,28 +2151,60 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 
 			self.targets = ["open", "build"]
 			self.fontelloConfigFiles = []
-			for f in os.listdir(self.project_folder):
-				if re.match(r'fontello_.*\.json', f):
-					self.fontelloConfigFiles.append([(('.').join(f.split('.')[:-1])).split('_')[-1:][0], f])
+			for f in fontelloConfigFiles(self.project_folder):
+				self.fontelloConfigFiles.append([(('.').join(f.split('.')[:-1])).split('_')[-1:][0], f])
 			print(self.fontelloConfigFiles)
-			options = self.fontelloConfigFiles[:]
-			options.insert(0, ["create",""])
+			options = self.fontello_config_options()
 			if sessionHasSetting('fontelloCurrent'):
 				fontello = sessionSetting('fontelloCurrent')
 				print(fontello)
-				if (datetime.now() - datetime.fromtimestamp(fontello[3])) > timedelta(hours = 20):
+				configPath = os.path.join(self.project_folder, fontello[1])
+				sessionId = None
+				if os.path.isfile(configPath):
+					with open(configPath, mode='rb') as f:
+						sessionId = fontelloSessions.lookup(f.read())
+				if sessionId is None:
 					sessionRemoveSetting('fontelloCurrent')
 				else:
-					options = [['open ' + fontello[0], fontello[1]], ['build ' + fontello[0], fontello[1]], 'other']
+					options = [['open ' + fontello[0], fontello[1]], ['build ' + fontello[0], fontello[1]], ['other', '']]
 					self.fontelloConfigFile = [fontello[0], fontello[1]]
-					self.fontelloSessionId = fontello[2]
+					self.fontelloSessionId = sessionId
 					self.show_quick_panel(options, self.select_fontello_current)
 					return
 			print(options)
 			self.show_quick_panel(options, self.select_fontello_config)
 		else:  # clean project
-			self.command = "clean"
-			self.runProjectCommand()
+			self.pick_clean()
+
+	#--------------------------------------------------------------
+	# CLEAN
+	#--------------------------------------------------------------
+
+	def pick_clean(self):
+		self.cleanPlatforms = []
+		options = []
+		for platform in ["all"] + list(CLEAN_TARGETS):
+			folders = cleanTargets(self.project_folder, platform)
+			if folders:
+				self.cleanPlatforms.append(platform)
+				options.append(["all platforms" if platform == "all" else platform, ", ".join(os.path.relpath(folder, self.project_folder) for folder in folders)])
+		if not options:
+			sublime.status_message("Titanium: nothing to clean in " + os.path.basename(self.project_folder))
+			return
+		self.show_quick_panel(options, self.select_clean)
+
+	def select_clean(self, select):
+		if select < 0:
+			return
+		platform = self.cleanPlatforms[select]
+		folders = cleanTargets(self.project_folder, platform)
+		if get_setting("cleanInBackground", True):
+			folders = detachFolders(self.project_folder, folders)
+		sublime.status_message("Titanium: cleaning " + os.path.basename(self.project_folder) + "...")
+		name = "all platforms" if platform == "all" else platform
+		def done(freed):
+			sublime.status_message("Titanium: cleaned " + name + ", freed " + formatSize(freed))
+		runInBackground(lambda: removeFolders(folders), done, self.handleError)
 
 	# Sublime Text 3 requires a short timeout between quick panels
 	def show_quick_panel(self, options, done): 
@@ -317,89 +2215,44 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		sublime.set_timeout(lambda: self.window.show_input_panel(hint, default, done, None, None), 10)
 
 
-	# get the current project's SDK from tiapp.xml
-	def get_project_sdk_version(self):
-		cmd = [self.node, self.cli, "project", "sdk-version", "--project-dir", self.project_folder, "--log-level", "error", "--output", "json"]
-		print(" ".join(cmd))
-		process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-		result, error = process.communicate()
-		info = json.loads(result.decode('utf-8'))
-		print(info)
-		return info
-
-	def run_titanium(self, options=[]):
+	def run_titanium(self, options=[], artifact=None):
 		cmd = self.preCmd +["build", "--platform", self.platform, "--log-level", self.loggingLevel, "--no-colors"]
 		if (self.platform is "ios" and self.iosVersion is not "unknown" and self.iosVersion is not ""):
 			options.extend(["--ios-version", self.iosVersion])
 		cmd.extend(options)
 
 		# save most recent command
-
-		sessionSetting('titaniumMostRecent', cmd)
-
-		titaniumMostRecents = sessionSetting('titaniumMostRecents')
-		if (not titaniumMostRecents):
-			titaniumMostRecents = collections.deque([[self.project_folder, self.platform, self.target, options, cmd]])
-		else:
-			titaniumMostRecents.appendleft([self.project_folder, self.platform, self.target, options, cmd])
-			if (len(titaniumMostRecents) > 10):
-				titaniumMostRecents.pop()
-		sessionSetting('titaniumMostRecents', titaniumMostRecents)
-		self.runWindowCommand(cmd)
+		entry = history.record(self.project_folder, self.platform, self.target, options, cmd)
+		sessionSetting('titaniumMostRecent', entry['key'])
+		self.runWindowCommand(cmd, entry['key'], artifact)
+
+	def build_dist(self, options, identity, bump=None):
+		# offers the artifact of an earlier build from the same inputs, otherwise bumps and builds
+		outputDir = os.path.join(self.project_folder, self.outputDir)
+		projectDir, platform, sdk = self.project_folder, self.platform, self.project_sdk
+		def build(fingerprint=None):
+			if bump is not None:
+				bump()
+			artifact = {"dir": outputDir, "platform": platform, "fingerprint": fingerprint} if fingerprint else None
+			self.run_titanium(options, artifact)
+		def check(fingerprint):
+			artifact = findArtifact(outputDir, platform, fingerprint)
+			if artifact is not None and sublime.ok_cancel_dialog(os.path.basename(artifact) + " was built from the same sources, SDK and signing identity.\n\nReuse it instead of building again?", "Reuse"):
+				sublime.status_message("Titanium: reusing " + artifact)
+				self.window.run_command("open_dir", {"dir": outputDir, "file": os.path.basename(artifact)})
+				return
+			build(fingerprint)
+		def failed(error):
+			print("Titanium: could not fingerprint " + projectDir + ": " + str(error))
+			build()
+		if not get_setting("reuseArtifacts", True):
+			build()
+			return
+		runInBackground(lambda: projectFingerprint(projectDir, platform, sdk, identity), check, failed)
 
 	#--------------------------------------------------------------
 	# FONTELLO
 	#--------------------------------------------------------------
-	def filterPick(self, lines, regex):
-		return [m.group() for m in (re.search(regex, l) for l in lines) if m]
-		# matches = map(re.compile(regex).match, lines)
-		# return [m.group(1) for m in matches if m]
-
-
-	def extractFileFromZip(self, zipfile, fileZipPath, outputPath):
-		# copy file (taken from zipfile's extract)
-		source = zipfile.open(fileZipPath)
-		target = open(outputPath, "wb")
-		with source, target:
-			shutil.copyfileobj(source, target)
-
-
-	def generateIconicFont(self, configJSON, fontName):
-		glyphs = []
-		fileContent = "function Font(options) {\n\tthis.fontfamily = '" + fontName + "';\n\tthis.charcode = {\n"
-		for glyph in configJSON["glyphs"]:
-			if ("selected" not in glyph or glyph["selected"] == True):
-				fileContent += "\t\t'" + glyph["css"] + "': " + hex(glyph["code"]) + ",\n"
-		fileContent += "\t};\n}\nFont.prototype.getCharcode = function(options) {\n\treturn this.charcode[options];\n};\nmodule.exports = Font;"
-		target = open(os.path.join(self.project_folder, "Resources", "fonts", "font_" + fontName + ".js"), encoding='utf-8', mode='w')
-		target.write(fileContent)
-		target.close()
-
-	def buildFontelloFontForTi(self, fontName, fontConfigFile, fontelloSessionId):
-		configPath = os.path.join(self.project_folder, fontConfigFile)
-		zipPath = os.path.join("/tmp/", ".fontello.zip")
-
-		curl = ["curl", "--silent", "--show-error", "--fail"]
-		curl.extend(["--output", zipPath])
-		curl.extend(["http://www.fontello.com/"+ fontelloSessionId + "/get"])
-		print(' '.join(curl))
-		subprocess.Popen(curl, stdout=subprocess.PIPE).communicate()[0].decode()
-		zipfile = ZipFile(zipPath)
-		filenames = zipfile.namelist()
-		configFile = self.filterPick(filenames, ".*\/config\.json")[0]
-		fontFile = self.filterPick(filenames, ".*\/font/.*\.ttf")[0]
-		fontName = None
-		if (configFile):
-			print(configFile)
-			self.extractFileFromZip(zipfile, configFile, configPath)
-			file = open(configPath, encoding='utf-8', mode='r')
-			configJSON = json.loads(file.read())
-			fontName = configJSON["name"]
-			self.generateIconicFont(configJSON, fontName)
-
-		if (fontFile and fontName  is not None):
-			self.extractFileFromZip(zipfile, fontFile, os.path.join(self.project_folder, "Resources", "fonts", fontName + ".ttf"))
-
 	def createFontelloFont(self, name):
 		print(name)
 		fontConfigFileName =  "fontello_" + name + ".json"
@@ -414,26 +2267,32 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		self.run_fontello_command("open")
 
 	def run_fontello_command(self, cmd):
-		if not hasattr(self, 'fontelloSessionId'):
-			curl = ["curl", "--silent", "--show-error", "--fail", "-H", "Accept: application/json", "--form"]
-			curl.extend(["config=@" + os.path.join(self.project_folder,self.fontelloConfigFile[1])])
-			curl.extend(["http://fontello.com"])
-			print(' '.join(curl))
-			self.fontelloSessionId = subprocess.Popen(curl, stdout=subprocess.PIPE).communicate()[0].decode()
-			
+		client = FontelloClient()
+		projectDir = self.project_folder
+		fontelloConfigFile = self.fontelloConfigFile
+		extras = get_setting("fontelloExtras", False)
+		def work():
+			with open(os.path.join(projectDir, fontelloConfigFile[1]), mode='rb') as f:
+				config = f.read()
+			sessionId = fontelloSessions.get(config, client, projectDir)
+			if(cmd == 'build'):
+				buildFontelloFont(projectDir, fontelloConfigFile[1], sessionId, client, extras)
+			return sessionId
+		def done(sessionId):
+			self.fontelloSessionId = sessionId
 			sessionSetting('fontelloCurrent', [
-				self.fontelloConfigFile[0],
-				self.fontelloConfigFile[1],
-				self.fontelloSessionId,
-				int(datetime.now().strftime("%s"))
+				fontelloConfigFile[0],
+				fontelloConfigFile[1],
+				sessionId,
+				int(time.time())
 			])
 			print(sessionSetting('fontelloCurrent'))
-		if(cmd == 'open'):
-			webbrowser.open_new_tab('http://fontello.com/'+self.fontelloSessionId)
-		elif(cmd == 'build'):
-			self.buildFontelloFontForTi(self.fontelloConfigFile[0],
-				self.fontelloConfigFile[1],
-				self.fontelloSessionId)
+			if(cmd == 'open'):
+				webbrowser.open_new_tab(client.sessionUrl(sessionId))
+			else:
+				sublime.status_message("Titanium: fontello font " + fontelloConfigFile[0] + " built")
+		sublime.status_message("Titanium: fontello " + cmd + " " + fontelloConfigFile[0] + "...")
+		runInBackground(work, done, self.handleError)
 
 	def select_fontello_current(self, select):
 		if select < 0:
@@ -444,9 +2303,13 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		elif select == 1:
 			self.select_fontello_command(2)
 		else: #other
-			options = self.fontelloConfigFiles[:]
-			options.insert(0, ["create",""])
-			self.show_quick_panel(options, self.select_fontello_config)
+			self.show_quick_panel(self.fontello_config_options(), self.select_fontello_config)
+
+	def fontello_config_options(self):
+		options = self.fontelloConfigFiles[:]
+		options.insert(0, ["create",""])
+		options.insert(1, ["build all", str(len(self.fontelloConfigFiles)) + " fonts, unchanged ones are skipped"])
+		return options
 
 
 	def select_fontello_command(self, select):
@@ -465,8 +2328,10 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 			return
 		elif select == 0:
 			self.select_fontello_command(0)
+		elif select == 1:
+			self.window.run_command("titanium_build_all_fonts", {"project_dir": self.project_folder})
 		else:
-			self.fontelloConfigFile = self.fontelloConfigFiles[select-1]
+			self.fontelloConfigFile = self.fontelloConfigFiles[select-2]
 			self.show_quick_panel(self.targets, self.select_fontello_target)
 
 	def select_fontello_target(self, select):
@@ -483,7 +2348,8 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		if select < 0:
 			return
 
-		self.run_titanium(["--deploy-type", self.targets[select]])
+		self.target = self.targets[select]
+		self.run_titanium(["--deploy-type", self.target])
 
 	#--------------------------------------------------------------
 	# ANDROID
@@ -496,34 +2362,64 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		if (self.target == "emulator auto"):
 			self.run_titanium([])
 		elif (self.target == "emulator"):
-			self.load_android_info()
-			self.avds= []
-			print(self.simulators)
-			for simulator in self.simulators:
-				if "target" in simulator:
-					self.avds.append([simulator['name'], simulator['target']])
-			self.show_quick_panel(self.avds, self.select_android_avd)
+			androidSDK = self.androidSDK
+			runInBackground(lambda: discoverAndroidDevices(androidSDK), self.show_android_devices, self.handleError)
 		elif(self.target == "dist-adhoc"):
-			self.updateAndroidBuildInTiApp()
 			options = ["--target", 'device', "--output-dir", os.path.join(self.project_folder,self.outputDir)]
 			options.extend(['--deploy-type', "test"])
 			# options.extend(['--build-only'])
-			self.run_titanium(options)
+			self.build_dist(options, [self.target], lambda: self.updateBuildInTiApp(android=True))
 		elif(self.target == "dist-playstore"):
-			self.updateAndroidBuildInTiApp()
 			certsPath = os.path.join(self.project_folder, self.certsDir)
+			keystore = os.path.join(certsPath, get_setting("android.keystore", "android.keystore"))
+			alias = get_setting("android.alias", "")
 			options = ["--target", self.target, "--output-dir", os.path.join(self.project_folder,self.outputDir)]
 			options.extend(["--store-password", get_setting("android.store-password", "")])
-			options.extend(["--alias", get_setting("android.alias", "")])
-			options.extend(['--keystore',  os.path.join(certsPath, get_setting("android.keystore", "android.keystore"))])
-			self.run_titanium(options)
+			options.extend(["--alias", alias])
+			options.extend(['--keystore',  keystore])
+			self.build_dist(options, [self.target, keystore, alias], lambda: self.updateBuildInTiApp(android=True))
 		else:
 			self.run_titanium(["--target", self.target])
 
+	def show_android_devices(self, devices):
+		# running devices first, then the AVDs, then the full titanium info list
+		running, avds = devices
+		self.avds = []
+		self.avdOptions = []
+		runningAvds = set()
+		for device in running:
+			if device['avd'] is not None:
+				runningAvds.add(device['avd'])
+				self.avds.append([device['avd'], "running emulator " + device['serial']])
+				self.avdOptions.append(["--device-id", device['avd']])
+			else:
+				self.avds.append([device['model'], "running device " + device['serial']])
+				self.avdOptions.append(["--target", "device", "--device-id", device['serial']])
+		for avd in avds:
+			if avd['name'] not in runningAvds:
+				self.avds.append([avd['name'], avd['target']])
+				self.avdOptions.append(["--device-id", avd['name']])
+		self.avds.append(["more...", "list the emulators known to titanium info"])
+		self.avdOptions.append(None)
+		self.show_quick_panel(self.avds, self.select_android_avd)
+
+	def show_android_avds(self):
+		self.avds= []
+		self.avdOptions = []
+		print(self.simulators)
+		for simulator in self.simulators:
+			if "target" in simulator:
+				self.avds.append([simulator['name'], simulator['target']])
+				self.avdOptions.append(["--" + self.avdCmd, simulator['name']])
+		self.show_quick_panel(self.avds, self.select_android_avd)
+
 	def select_android_avd(self, select):
 		if select < 0:
 			return
-		self.run_titanium(["--" + self.avdCmd, self.avds[select][0]])
+		if self.avdOptions[select] is None:
+			self.load_android_info(self.show_android_avds)
+		else:
+			self.run_titanium(self.avdOptions[select])
 
 	#--------------------------------------------------------------
 	# IOS
@@ -534,20 +2430,39 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 			return
 		self.target = self.targets[select]
 		if self.target == "simulator":
-			self.load_ios_info()
-			self.simtype= []
-			for simulator in self.simulators:
-				if ('id' in simulator):
-					self.simtype.append(simulator['id'])
-				else:
-					self.simtype.append([simulator['name'], simulator['udid']])
-			self.show_quick_panel(self.simtype, self.select_ios_simtype)
+			runInBackground(discoverIosSimulators, self.show_simctl_simulators, self.handleError)
 		elif self.target == "simulator auto":
 			self.run_titanium([])
 		else:
 			self.families = ["iphone", "ipad", "universal"]
 			self.show_quick_panel(self.families, self.select_ios_family)
 
+	def show_ios_simulators(self):
+		self.simtype= []
+		for simulator in self.iosEnv.simulators():
+			if ('id' in simulator):
+				self.simtype.append(simulator['id'])
+			else:
+				self.simtype.append([simulator['name'], simulator['udid']])
+		self.show_quick_panel(self.simtype, self.select_ios_simtype)
+
+	def show_simctl_simulators(self, index):
+		if index is None:
+			# no simctl around, ask titanium info
+			self.load_ios_info(self.show_ios_simulators)
+			return
+		rows = [i for runtime, indexes in index['byRuntime'].items() if runtime.startswith("iOS") for i in indexes]
+		self.simulatorRows = [index['devices'][i] for i in sorted(rows)]
+		options = []
+		for name, udid, runtime, family, booted in self.simulatorRows:
+			options.append([name, runtime + (" (booted)" if booted else "")])
+		self.show_quick_panel(options, self.select_simctl_simulator)
+
+	def select_simctl_simulator(self, select):
+		if select < 0:
+			return
+		self.run_titanium(["--device-id", self.simulatorRows[select][1], "--device-family", "universal"])
+
 	def select_ios_simtype(self, select):
 		if select < 0:
 			return
@@ -566,6 +2481,7 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		if select < 0:
 			return
 		self.family = self.families[select]
+		self.profile = None
 		if (self.certsDir is not "unknown"):
 			certsPath = os.path.join(self.project_folder, self.certsDir)
 			if (self.target == "device"):
@@ -574,19 +2490,41 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 				certPath = os.path.join(certsPath, "appstore.mobileprovision")
 			else:
 				certPath = os.path.join(certsPath, "distribution.mobileprovision")
-			try:
-				self.profile, self.teamname, self.teamid = self.getUUIDAndName(certPath)
-				self.teamfullname = self.teamname + " (" + self.teamid + ")"
-				self.copyProvisioningProfile(certPath, self.profile)
-				if (self.target != "device"):
-					self.build_ios_with_profile()
-					return
-			except Exception as e: 
-				self.handleError(e)
+			projectDir, target = self.project_folder, self.target
+			def findProfile():
+				with timed(projectDir, "provisioning profile"):
+					profileIndex.scan([certsPath])
+					return profileIndex.get(certPath) or profileIndex.lookup(certsPath, target)
+			runInBackground(findProfile, lambda entry: self.use_certs_dir_profile(certsPath, entry), self.handleError)
+			return
+
+		self.load_ios_info(self.pick_ios_keychain)
+
+	def use_certs_dir_profile(self, certsPath, entry):
+		try:
+			if entry is None:
+				raise IOError("no provisioning profile for " + self.target + " in " + certsPath)
+			tiapp = readTiApp(os.path.join(self.project_folder, "tiapp.xml"))
+			problems = profileProblems(entry, tiapp.id if tiapp else None)
+			if problems and not sublime.ok_cancel_dialog("\n".join(problems) + "\n\nBuild anyway?"):
+				return
+			self.profile, self.teamname, self.teamid = entry['uuid'], entry['teamName'], entry['teamId']
+			self.teamfullname = self.teamname + " (" + self.teamid + ")"
+			self.copyProvisioningProfile(entry['path'], self.profile)
+			if (self.target != "device"):
+				self.build_ios_with_profile()
 				return
+		except Exception as e: 
+			self.handleError(e)
+			return
+
+		self.load_ios_info(self.pick_ios_keychain)
 
-		self.load_ios_info()
-		if (self.defaultKeychain is not "unknown" and self.defaultKeychain in self.keychains):
+	def pick_ios_keychain(self):
+		self.keychainNames = list(self.iosEnv.keychains())
+		if not self.keychainNames:
+			sublime.error_message("Titanium: no keychain with signing certificates found")
+		elif (self.defaultKeychain is not "unknown" and self.defaultKeychain in self.keychainNames):
 			self.handle_ios_keychain(self.defaultKeychain)
 		else:
 			if (len(self.keychainNames) > 1):
@@ -594,23 +2532,8 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 			else:
 				self.select_ios_keychain(0)
 
-	def get_ios_certs_from_keychain(self):
-		propName = 'distribution'
-		if (self.target=='device'):
-			propName = 'developer'
-		certs = self.keychain[propName]
-		self.certs = []
-		for obj in certs:
-			if (isinstance(obj, str)):
-				self.certs.append(obj)
-			elif (obj['invalid'] == False):
-				self.certs.append(obj['name'])
-
-
 	def handle_ios_keychain(self, name):
-		self.load_ios_info()
-		self.keychain = self.keychains[name]
-		self.get_ios_certs_from_keychain()
+		self.certs = self.iosEnv.certs(name, 'developer' if self.target == 'device' else 'distribution')
 		if (len(self.certs) > 1):
 			self.show_quick_panel(self.certs, self.select_ios_cert)
 		else:
@@ -619,18 +2542,17 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 	def select_ios_keychain(self, select):
 		if select < 0:
 			return
-		self.load_ios_info()
 		self.handle_ios_keychain(self.keychainNames[select])
 
 	def select_ios_cert(self, select):
 		if select < 0:
 			return
-		self.load_ios_info()
 		self.cert = self.certs[select]
 		
 		if (self.profile is not None):
 			self.build_ios_with_profile()
 		else:
+			self.profiles = self.iosEnv.profiles(self.target)
 			if (len(self.profiles) > 1):
 				self.show_quick_panel(self.profiles, self.select_ios_profile)
 			else:
@@ -640,6 +2562,19 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 		if select < 0:
 			return
 		self.teamfullname, self.profile = self.profiles[select]
+		profileId = self.profile
+		def findProfile():
+			profileIndex.scan([PROVISIONING_PROFILES_DIR])
+			return profileIndex.find(PROVISIONING_PROFILES_DIR, profileId)
+		runInBackground(findProfile, self.check_ios_profile, self.handleError)
+
+	def check_ios_profile(self, entry):
+		# titanium info does not say whether a profile expired or fits the app id, the index does
+		if entry is not None:
+			tiapp = readTiApp(os.path.join(self.project_folder, "tiapp.xml"))
+			problems = profileProblems(entry, tiapp.id if tiapp else None)
+			if problems and not sublime.ok_cancel_dialog("\n".join(problems) + "\n\nBuild anyway?"):
+				return
 		self.build_ios_with_profile()
 
 	def build_ios_with_profile(self):
@@ -653,19 +2588,30 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 			options.extend(["--distribution-name", self.teamfullname])
 		if self.target == "dist-adhoc" or target == "device-adhoc":
 			options.extend(["--deploy-type", 'test'])
+		bump = None
 		if self.target == "dist-adhoc" or target == "dist-appstore":
-			self.updateIOsBuildInTiApp();
+			bump = lambda: self.updateBuildInTiApp(ios=True)
 		if target == "dist-adhoc" or target == "device":
 			options.extend(["--output-dir", os.path.join(self.project_folder,self.outputDir), '--device-id', 'all'])
+		if target == "dist-adhoc":
+			# the .ipa lands in outputDir, app store builds go to an Xcode archive
+			self.build_dist(options, [self.target, self.profile, self.teamfullname, self.family], bump)
+			return
+		if bump is not None:
+			bump()
 		self.run_titanium(options)
 
-	def load_android_info(self):
+	def load_android_info(self, callback):
 		if(self.infoLoaded):
+			callback()
 			return
-		self.infoLoaded = True
-		process = subprocess.Popen( self.preCmd + ["info", "--types", "android", "--log-level", "error", "--output", "json"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-		result, error = process.communicate()
-		info = json.loads(result.decode('utf-8'))
+		def loaded(info):
+			self.parse_android_info(info)
+			self.infoLoaded = True
+			callback()
+		self.with_result('android', loaded)
+
+	def parse_android_info(self, info):
 		print (info)
 		if "android" in info:
 			android = info['android'];
@@ -676,67 +2622,317 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 				self.avdCmd = "avd-id"
 				self.simulators = android["avds"]
 
-	def load_ios_info(self):
-		if(self.infoLoaded):
+	def load_ios_info(self, callback):
+		def loaded(info):
+			self.iosEnv = iosEnvironmentFor(info)
+			callback()
+		self.with_result('ios', loaded)
+
+class TitaniumRefreshInfoCommand(sublime_plugin.WindowCommand):
+
+	def run(self):
+		clearInfoCache()
+		forgetPrefetch()
+		settingsResolver.invalidate()
+		projectIndex.forget(self.window)
+		node = get_setting("nodejs", "/usr/local/bin/node")
+		cli = get_setting("titaniumCLI", "/usr/local/bin/titanium")
+		for folder in self.window.folders():
+			if os.path.isfile(os.path.join(folder, "tiapp.xml")):
+				prefetchProject(node, cli, folder)
+		sublime.status_message("Titanium: reloading environment info")
+
+class TitaniumPrefetchListener(sublime_plugin.EventListener):
+
+	# warm up sdk version and device info as soon as a Titanium project window gets focus
+	def on_activated_async(self, view):
+		window = view.window()
+		if window is None:
 			return
-		self.infoLoaded = True
-		process = subprocess.Popen( self.preCmd + ["info", "--types", "ios", "--log-level", "error", "--output", "json"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-		result, error = process.communicate()
-		info = json.loads(result.decode('utf-8'))
-		# print (info)
-		if "ios" in info:
-			ios = info['ios'];
-			if "certs" in ios:
-				for target, c in list(ios["certs"].items()):
-					if target == "wwdr" or (target == "devNames" and self.target != "device") or (target == "distNames" and self.target == "device"):
-						continue
-					keychains = []
-					self.keychains = {}
-					for keychain in c:
-						keychains.append(keychain)
-						self.keychains[keychain] = c[keychain]
-					self.keychainNames = keychains
-			if "provisioningProfiles" in ios:
-				for target, p in list(ios["provisioningProfiles"].items()):
-					# TODO: figure out what to do with enterprise profiles
-					if (target == "development" and self.target == "device") or (target == "distribution" and self.target == "dist-appstore") or (target == "adhoc" and self.target == "dist-adhoc"):
-						l = []
-						for profile in p:
-							l.append([profile['name'], profile['uuid']])
-						self.profiles = l
-			if "simulators" in ios:
-				print("test1" )
-				selectedXcode = ios["selectedXcode"]
-				print(selectedXcode)
-				if ("sims" in selectedXcode):
-					print("test2" )
-					sdks = selectedXcode["sdks"]
-					sims = selectedXcode["sims"]
-
-					self.simulators = ios["simulators"][selectedXcode['sims'][0]]
-					print("toto" + str(self.simulators))
-				else:
-					self.simulators = ios["simulators"]
+		for folder in window.folders():
+			if isPrefetchFresh(folder) or not os.path.isfile(os.path.join(folder, "tiapp.xml")):
+				continue
+			prefetchProject(get_setting("nodejs", "/usr/local/bin/node", view), get_setting("titaniumCLI", "/usr/local/bin/titanium", view), folder)
+
+class TitaniumSettingsListener(sublime_plugin.EventListener):
+
+	# drop the cached settings when the project settings may have changed
+	def on_post_save(self, view):
+		if (view.file_name() or '').endswith('.sublime-project'):
+			settingsResolver.invalidate()
+
+	def on_load_project(self, window):
+		settingsResolver.invalidate(window)
+
+	def on_post_save_project(self, window):
+		settingsResolver.invalidate(window)
+
+	def on_pre_close_window(self, window):
+		settingsResolver.invalidate(window)
+
+class TitaniumProjectIndexListener(sublime_plugin.EventListener):
+
+	# keep the project index in step with the folders of the window
+	def on_activated_async(self, view):
+		window = view.window()
+		if window is not None:
+			projectIndex.sync(window)
+
+	def on_post_save_async(self, view):
+		window = view.window()
+		if window is not None and os.path.basename(view.file_name() or '') == "tiapp.xml":
+			projectIndex.added(window, os.path.dirname(view.file_name()))
+
+	def on_pre_close_window(self, window):
+		projectIndex.forget(window)
+
+class TitaniumWatchListener(sublime_plugin.EventListener):
+
+	def on_load(self, view):
+		buildWatcher.track(view)
+
+	def on_activated(self, view):
+		buildWatcher.track(view)
+
+	def on_post_save(self, view):
+		if view.window() is not None and view.file_name():
+			buildWatcher.saved(view.window(), view.file_name())
+
+class TitaniumToggleWatchCommand(sublime_plugin.WindowCommand):
+
+	def run(self):
+		enabled = buildWatcher.toggle(self.window)
+		sublime.status_message("Titanium: watch mode " + ("on, saves below app/ and Resources/ rebuild the last configuration" if enabled else "off"))
+
+	def is_checked(self):
+		return buildWatcher.enabled(self.window)
+
+class TitaniumBumpBuildNumbersCommand(sublime_plugin.WindowCommand):
+
+	def run(self, ios=True, android=True, dry_run=False):
+		for folder in self.window.folders():
+			tiappPath = os.path.join(folder, "tiapp.xml")
+			if os.path.isfile(tiappPath):
+				numbers = bumpBuildNumbers(tiappPath, ios=ios, android=android, dryRun=dry_run)
+				sublime.status_message("Titanium: " + os.path.basename(folder) + (" would be bumped to " if dry_run else " bumped to ") + str(numbers))
+
+class BuildMatrixRun(object):
+
+	# one run of the build matrix, a second run started meanwhile keeps its own builds and counter
+	def __init__(self, window, matrix, projectDir, node, cli, loggingLevel, iosVersion, concurrency):
+		self.window = window
+		self.matrix = matrix
+		self.project_folder = projectDir
+		self.node = node
+		self.cli = cli
+		self.loggingLevel = loggingLevel
+		self.iosVersion = iosVersion
+		self.concurrency = concurrency
+		self.builds = []
+		self.pending = 0
+		self.lock = threading.Lock()
+
+	def start(self, future):
+		try:
+			sdk = future.result()
+		except Exception as e:
+			print(e)
+			sublime.error_message("Titanium: could not get the project sdk version")
+			return
+		bumps = set()
+		for i, entry in enumerate(self.matrix):
+			if isinstance(entry, dict):
+				platform, target, options = entry["platform"], entry["target"], entry.get("options", [])
+				if entry.get("bump", False):
+					bumps.add(platform)
+			else:
+				platform, target, options = entry[0], entry[1], (entry[2] if len(entry) > 2 else [])
+			cmd = [self.node, self.cli, "--sdk", sdk, "--project-dir", self.project_folder, "build", "--platform", platform, "--log-level", self.loggingLevel, "--no-colors", "--target", target]
+			if platform == "ios" and self.iosVersion not in ("", "unknown"):
+				cmd.extend(["--ios-version", self.iosVersion])
+			cmd.extend(options)
+			# entries may share platform and target, the index keeps their panels apart
+			self.builds.append(BuildProcess(self.window, "titanium_%d_%s_%s" % (i + 1, platform, target), cmd))
+		if bumps:
+			bumpBuildNumbers(os.path.join(self.project_folder, "tiapp.xml"), ios="ios" in bumps, android="android" in bumps)
+
+		self.pending = len(self.builds)
+		pool = ThreadPoolExecutor(max_workers=self.concurrency)
+		for build in self.builds:
+			pool.submit(build.run).add_done_callback(self.on_build_done)
+		pool.shutdown(wait=False)
+		self.window.run_command("show_panel", {"panel": "output." + self.builds[0].name})
+		sublime.status_message("Titanium: running " + str(self.pending) + " builds")
+
+	def on_build_done(self, future):
+		with self.lock:
+			self.pending -= 1
+			if self.pending > 0:
+				return
+		sublime.set_timeout(self.show_summary, 0)
+
+	def show_summary(self):
+		panel = self.window.create_output_panel("titanium_matrix")
+		lines = []
+		for build in self.builds:
+			status = "ok" if build.returncode == 0 else "FAILED (" + str(build.returncode) + ")"
+			duration = "" if build.duration is None else " in %.1fs" % build.duration
+			lines.append(build.name + ": " + status + duration + "\n")
+		panel.run_command('append', {'characters': "".join(lines), 'force': True})
+		self.window.run_command("show_panel", {"panel": "output.titanium_matrix"})
+
+class TitaniumBuildMatrixCommand(sublime_plugin.WindowCommand):
+
+	# runs every (platform, target, options) entry of the "buildMatrix" setting in parallel
+	def run(self, project_dir=None):
+		matrix = get_setting("buildMatrix", [])
+		if not matrix:
+			sublime.message_dialog("Titanium: no \"buildMatrix\" configured in the settings")
+			return
+		if project_dir is None:
+			for folder in self.window.folders():
+				if os.path.isfile(os.path.join(folder, "tiapp.xml")):
+					project_dir = folder
+					break
+		if project_dir is None:
+			sublime.message_dialog("Titanium: no tiapp.xml found in the open folders")
+			return
+		node = get_setting("nodejs", "/usr/local/bin/node")
+		cli = get_setting("titaniumCLI", "/usr/local/bin/titanium")
+		matrixRun = BuildMatrixRun(self.window, matrix, project_dir, node, cli,
+			get_setting("loggingLevel", "debug"), str(get_setting("iosVersion", "")),
+			max(1, int(get_setting("buildMatrixConcurrency", 2))))
+		whenDone(executor.submit(projectSdkVersion, node, cli, project_dir), matrixRun.start)
+
+class TitaniumExecCommand(sublime_plugin.WindowCommand):
+
+	def run(self, cmd=None, kill=False, history_key=None, artifact=None):
+		current = buildProcesses.get((self.window.id(), "titanium"))
+		if current is not None:
+			current.kill()
+		if kill:
+			return
+		build = BuildProcess(self.window, "titanium", cmd)
+		if history_key is not None:
+			build.onDone.append(lambda build: history.setDuration(history_key, build.duration, build.returncode))
+		if artifact is not None:
+			def recordArtifact(build):
+				if build.returncode == 0:
+					recordArtifacts(artifact["dir"], artifact["platform"], artifact["fingerprint"], build.start)
+			build.onDone.append(recordArtifact)
+		self.window.run_command("show_panel", {"panel": "output.titanium"})
+		threading.Thread(target=build.run).start()
+
+class TitaniumTrimPanelCommand(sublime_plugin.TextCommand):
+
+	def run(self, edit, lines):
+		self.view.set_read_only(False)
+		self.view.erase(edit, sublime.Region(0, self.view.text_point(lines, 0)))
+		self.view.set_read_only(True)
+
+class TitaniumNextErrorCommand(sublime_plugin.WindowCommand):
+
+	def build(self):
+		# the build shown in the active output panel, defaulting to the last single build
+		panel = self.window.active_panel() or ""
+		if panel.startswith("output."):
+			build = buildProcesses.get((self.window.id(), panel[len("output."):]))
+			if build is not None:
+				return build
+		return buildProcesses.get((self.window.id(), "titanium"))
+
+	def run(self):
+		build = self.build()
+		if build is not None:
+			build.navigate(1)
+
+class TitaniumPrevErrorCommand(TitaniumNextErrorCommand):
+
+	def run(self):
+		build = self.build()
+		if build is not None:
+			build.navigate(-1)
+
+class TitaniumPerformanceReportCommand(sublime_plugin.WindowCommand):
+
+	def run(self):
+		report = []
+		for folder in self.window.folders():
+			if os.path.isfile(os.path.join(folder, "tiapp.xml")):
+				report.append(timingsReport(folder))
+		panel = self.window.create_output_panel("titanium_performance")
+		panel.run_command('append', {'characters': "\n".join(report) or "no Titanium project open\n", 'force': True})
+		self.window.run_command("show_panel", {"panel": "output.titanium_performance"})
+
+class TitaniumSyncProfilesCommand(sublime_plugin.WindowCommand):
+
+	def run(self):
+		certsDir = str(get_setting("iosCertsDir", "unknown"))
+		folders = [os.path.join(folder, certsDir) for folder in self.window.folders() if os.path.isdir(os.path.join(folder, certsDir))]
+		if not folders:
+			sublime.status_message("Titanium: no " + certsDir + " folder in the open projects")
+			return
+		whenDone(executor.submit(lambda: [syncProvisioningProfiles(folder) for folder in folders]), self.on_done)
 
-		else:
-			if "iosKeychains" in info:
-				self.keychainNames = info["iosKeychains"]
-			if "keychains" in info:
-				self.keychains = info["keychains"]
-			if "iosCerts" in info:
-				for target, c in list(info["iosCerts"].items()):
-					if target == "wwdr" or (target == "devNames" and self.target != "device") or (target == "distNames" and self.target == "device"):
-						continue
-					l = []
-					for cert in c:
-						l.append(cert)
-					self.certs = l
-			if "iOSProvisioningProfiles" in info:
-				for target, p in list(info["iOSProvisioningProfiles"].items()):
-					# TODO: figure out what to do with enterprise profiles
-					if (target == "development" and self.target == "device") or (target == "distribution" and self.target == "dist-appstore") or (target == "adhoc" and self.target == "dist-adhoc"):
-						l = []
-						for profile in p:
-							l.append([profile['name'], profile['uuid']])
-						self.profiles = l
-			self.simulators = None
+	def on_done(self, future):
+		try:
+			summaries = future.result()
+		except Exception as e:
+			sublime.error_message("Titanium: could not sync provisioning profiles\n" + str(e))
+			return
+		counts = dict((action, sum(len(summary[action]) for summary in summaries)) for action in ("added", "updated", "unchanged"))
+		for summary in summaries:
+			for action in ("added", "updated"):
+				for name in summary[action]:
+					print(action + ": " + name)
+		sublime.status_message("Titanium: provisioning profiles %(added)d added, %(updated)d updated, %(unchanged)d unchanged" % counts)
+
+class TitaniumBuildAllFontsCommand(sublime_plugin.WindowCommand):
+
+	def run(self, project_dir=None, force=False):
+		folders = [project_dir] if project_dir else [folder for folder in self.window.folders() if os.path.isfile(os.path.join(folder, "tiapp.xml"))]
+		extras = get_setting("fontelloExtras", False)
+		sublime.status_message("Titanium: building fontello fonts...")
+		whenDone(executor.submit(lambda: [buildAllFontelloFonts(folder, extras=extras, force=force) for folder in folders]), self.on_done)
+
+	def on_done(self, future):
+		try:
+			summaries = future.result()
+		except Exception as e:
+			sublime.error_message("Titanium: could not build the fontello fonts\n" + str(e))
+			return
+		counts = dict((key, sum(len(summary[key]) for summary in summaries)) for key in ("built", "skipped", "failed"))
+		sublime.status_message("Titanium: fontello fonts %(built)d built, %(skipped)d unchanged, %(failed)d failed" % counts)
+
+class TitaniumCancelCommand(sublime_plugin.WindowCommand):
+
+	def run(self):
+		count = cancelCli()
+		builds = [build for (windowId, name), build in list(buildProcesses.items()) if windowId == self.window.id() and build.returncode is None]
+		for build in builds:
+			build.kill()
+		sublime.status_message("Titanium: cancelled " + str(count) + " running CLI calls and " + str(len(builds)) + " builds")
+
+class TitaniumBenchmarkCommand(sublime_plugin.WindowCommand):
+
+	# runs benchmark/hotpaths.py with a system python, on the info the CLI recorded on this machine
+	def run(self):
+		script = os.path.join(PLUGIN_FOLDER, "benchmark", "hotpaths.py")
+		if not os.path.isfile(script):
+			sublime.error_message("Titanium: the benchmarks only come with an unpacked package, " + script + " is missing")
+			return
+		cmd = [get_setting("benchmarkPython", "python3"), script,
+			"--node", get_setting("nodejs", "/usr/local/bin/node"),
+			"--runs", str(int(get_setting("benchmarkRuns", 5))),
+			"--latency", str(float(get_setting("benchmarkCliLatency", 0.2))),
+			"--recorded", CACHE_FOLDER]
+		sublime.status_message("Titanium: running benchmarks...")
+		runInBackground(lambda: runCli(cmd, "benchmarks", timeout=600), self.show_report, self.on_error)
+
+	def show_report(self, report):
+		panel = self.window.create_output_panel("titanium_benchmark")
+		panel.run_command('append', {'characters': report.decode('utf-8'), 'force': True})
+		self.window.run_command("show_panel", {"panel": "output.titanium_benchmark"})
+
+	def on_error(self, error):
+		sublime.error_message("Titanium: benchmark failed\n" + str(error))
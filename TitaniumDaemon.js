@@ -0,0 +1,137 @@
+// Long running host for the Titanium CLI, started by the Sublime Text plugin when "cliDaemon" is enabled.
+// Reads one JSON request per line on stdin:  {"id": 1, "args": ["info", "--types", "ios", "--output", "json"]}
+// and answers one JSON line per request:    {"id": 1, "code": 0, "stdout": "...", "stderr": "..."} or {"id": 1, "error": "...", "stderr": "..."}
+// A request is done when the CLI exits, when its output parses as JSON or when it has nothing left to wait for.
+// The CLI's own files are reloaded for every request, its dependencies and the SDK modules stay in the
+// require cache so only the first request pays for loading them.
+var fs = require('fs'),
+	path = require('path'),
+	readline = require('readline');
+
+var cliPath = fs.realpathSync(process.argv[2]),
+	cliRoot = path.dirname(cliPath),
+	realWrite = process.stdout.write.bind(process.stdout),
+	realExit = process.exit,
+	IDLE_POLL = 100,
+	queue = [],
+	current = null;
+
+while (!fs.existsSync(path.join(cliRoot, 'package.json')) && path.dirname(cliRoot) !== cliRoot) {
+	cliRoot = path.dirname(cliRoot);
+}
+
+function respond(message) {
+	realWrite(JSON.stringify(message) + '\n');
+}
+
+function finish(code, request) {
+	// a late callback of a previous request must not finish the current one
+	if (!current || (request && request !== current)) {
+		return;
+	}
+	request = current;
+	current = null;
+	respond({id: request.id, code: code || 0, stdout: request.complete || request.output.join(''), stderr: request.errors.join('')});
+	setImmediate(next);
+}
+
+function activeResources(polling) {
+	// handles, requests and timers keeping the event loop busy, less the idle poll's own timer
+	// which is still listed while it runs
+	if (process.getActiveResourcesInfo) {
+		return process.getActiveResourcesInfo().length - (polling ? 1 : 0);
+	}
+	return process._getActiveHandles().length + process._getActiveRequests().length;
+}
+
+function finishWhenIdle(request, baseline, idlePolls) {
+	// the CLI returned without exiting, it is done once nothing but the daemon's own handles is left
+	setTimeout(function () {
+		if (request !== current) {
+			return;
+		}
+		idlePolls = activeResources(true) <= baseline ? idlePolls + 1 : 0;
+		if (idlePolls >= 2) {
+			finish(0, request);
+		} else {
+			finishWhenIdle(request, baseline, idlePolls);
+		}
+	}, IDLE_POLL);
+}
+
+function done(callback) {
+	if (typeof callback === 'function') {
+		callback();
+	}
+	return true;
+}
+
+// everything the CLI prints belongs to the running request, late writes are dropped
+process.stdout.write = function (chunk, encoding, callback) {
+	if (current && !current.complete) {
+		current.output.push(String(chunk));
+		try {
+			// json output is complete as soon as it parses
+			JSON.parse(current.output.join(''));
+			current.complete = current.output.join('');
+			setImmediate(finish, 0, current);
+		} catch (e) {}
+	}
+	return done(typeof encoding === 'function' ? encoding : callback);
+};
+
+// so is stderr, it ends up in the error the plugin reports
+process.stderr.write = function (chunk, encoding, callback) {
+	if (current) {
+		current.errors.push(String(chunk));
+	}
+	return done(typeof encoding === 'function' ? encoding : callback);
+};
+
+process.exit = function (code) {
+	finish(code);
+};
+
+function run(request) {
+	current = request;
+	current.output = [];
+	current.errors = [];
+	Object.keys(require.cache).forEach(function (file) {
+		if (file.indexOf(cliRoot) === 0 && file.indexOf(path.join(cliRoot, 'node_modules')) !== 0) {
+			delete require.cache[file];
+		}
+	});
+	process.argv = [process.argv[0], cliPath].concat(request.args);
+	var baseline = activeResources();
+	try {
+		require(cliPath);
+	} catch (e) {
+		if (current === request) {
+			current = null;
+			respond({id: request.id, error: String(e && e.stack || e), stderr: request.errors.join('')});
+			setImmediate(next);
+		}
+		return;
+	}
+	finishWhenIdle(request, baseline, 0);
+}
+
+function next() {
+	if (!current && queue.length) {
+		run(queue.shift());
+	}
+}
+
+readline.createInterface({input: process.stdin}).on('line', function (line) {
+	try {
+		queue.push(JSON.parse(line));
+	} catch (e) {
+		respond({error: 'invalid request: ' + line});
+		return;
+	}
+	next();
+});
+
+process.stdin.on('end', function () {
+	realExit(0);
+});
@@ -0,0 +1,12 @@
+// Stand-in for the titanium CLI, copied next to a recording.json by hotpaths.writeStubCli.
+// Answers "info --types <platform>" with the recorded info of that platform after the recorded latency.
+var fs = require('fs'),
+	path = require('path');
+
+var args = process.argv.slice(2),
+	types = args.indexOf('--types'),
+	recording = JSON.parse(fs.readFileSync(path.join(__dirname, 'recording.json'), 'utf8'));
+
+setTimeout(function () {
+	process.stdout.write(JSON.stringify(recording.info[args[types + 1]] || {}));
+}, recording.latency);
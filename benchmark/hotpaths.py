@@ -0,0 +1,175 @@
+# Fixtures, the stub CLI and timings of the plugin's hot paths, shared by test_benchmark.py and the
+# "Titanium: Run Benchmarks" command, which runs this file with a system python:
+#
+#   python3 benchmark/hotpaths.py --node /usr/local/bin/node --runs 5 --latency 0.2 --recorded <cache folder>
+import argparse
+import contextlib
+import json
+import os
+import plistlib
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from io import BytesIO
+from zipfile import ZipFile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import Titanium
+
+FIXTURES = os.path.join(HERE, "fixtures")
+BENCHMARK_SDK = "benchmark"
+
+def fixtureInfo(platform):
+	return Titanium.readJSONFile(os.path.join(FIXTURES, "info_" + platform + ".json"), {})
+
+def recordedInfo(platform, folder):
+	# the newest info the real CLI gave on this machine, the shipped fixture when there is none yet
+	newest, newestTime = fixtureInfo(platform), 0
+	if folder and os.path.isdir(folder):
+		for f in os.listdir(folder):
+			path = os.path.join(folder, f)
+			if f.startswith("info_" + platform + "_") and f != os.path.basename(Titanium.infoCachePath(platform, BENCHMARK_SDK)) and os.path.getmtime(path) > newestTime:
+				cached = Titanium.readJSONFile(path)
+				if cached and 'info' in cached:
+					newest, newestTime = cached['info'], os.path.getmtime(path)
+	return newest
+
+def writeTiApp(path):
+	properties = "".join('\t<property name="benchmark.%d" type="string">value %d</property>\n' % (i, i) for i in range(200))
+	with open(path, encoding='utf-8', mode='w') as f:
+		f.write('<?xml version="1.0" encoding="UTF-8"?>\n<ti:app xmlns:ti="http://ti.appcelerator.org">\n'
+			'\t<id>com.example.benchmark</id>\n\t<name>benchmark</name>\n\t<version>1.0.0</version>\n' + properties +
+			'\t<ios>\n\t\t<plist>\n\t\t\t<dict>\n\t\t\t\t<key>CFBundleVersion</key>\n\t\t\t\t<string>41</string>\n\t\t\t</dict>\n\t\t</plist>\n\t</ios>\n'
+			'\t<android xmlns:android="http://schemas.android.com/apk/res/android">\n\t\t<manifest android:versionCode="41"/>\n\t</android>\n'
+			'\t<sdk-version>' + BENCHMARK_SDK + '</sdk-version>\n</ti:app>\n')
+
+def writeProfiles(folder, count):
+	for i in range(count):
+		plist = {
+			'UUID': str(uuid.uuid4()).upper(),
+			'Name': 'Benchmark %d' % i,
+			'TeamName': 'Benchmark',
+			'TeamIdentifier': ['ABCDE12345'],
+			'ExpirationDate': datetime.utcnow().replace(microsecond=0) + timedelta(days=365),
+			'Entitlements': {'application-identifier': 'ABCDE12345.com.example.app%d' % i, 'get-task-allow': i % 2 == 0},
+			'ProvisionedDevices': ['%040x' % device for device in range(100)]
+		}
+		# padding where the CMS signature of a real profile would be
+		with open(os.path.join(folder, "%d.mobileprovision" % i), 'wb') as f:
+			f.write(b'\x30\x80' * 2048 + plistlib.dumps(plist) + b'\x00' * 4096)
+
+def fontelloArchive():
+	archive = BytesIO()
+	glyphs = [{'css': 'icon-%d' % i, 'code': 0xe800 + i} for i in range(300)]
+	with ZipFile(archive, 'w') as zipfile:
+		zipfile.writestr('fontello-benchmark/config.json', json.dumps({'name': 'icons', 'glyphs': glyphs}))
+		zipfile.writestr('fontello-benchmark/font/icons.ttf', os.urandom(64 * 1024))
+		for name in ('fontello.css', 'fontello-codes.css', 'animation.css'):
+			zipfile.writestr('fontello-benchmark/css/' + name, '\n'.join('.icon-%d:before { content: "\\e%03x"; }' % (i, i) for i in range(300)))
+		zipfile.writestr('fontello-benchmark/font/icons.svg', '<svg>' + '<glyph/>' * 300 + '</svg>')
+	return archive.getvalue()
+
+def writeStubCli(folder, recording, latency):
+	# returns the path of fixtures/stub_cli.js copied to folder, answering with recording[platform]
+	cli = os.path.join(folder, "titanium.js")
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+	shutil.copyfile(os.path.join(FIXTURES, "stub_cli.js"), cli)
+	Titanium.writeJSONFile(os.path.join(folder, "package.json"), {"version": "0.0.0-" + BENCHMARK_SDK})
+	Titanium.writeJSONFile(os.path.join(folder, "recording.json"), {"latency": int(latency * 1000), "info": recording})
+	return cli
+
+def benchmark(results, name, fn, runs):
+	durations = []
+	try:
+		for i in range(runs):
+			start = time.time()
+			fn()
+			durations.append(time.time() - start)
+		results.append((name, durations))
+	except Exception as e:
+		results.append((name, e))
+
+def runBenchmarks(node, runs=5, latency=0.2, profileCount=200, recording=None):
+	# times the plugin's hot paths on fixtures and the stub CLI, [(name, durations or error)]
+	results = []
+	folder = tempfile.mkdtemp(prefix="titanium-benchmark-")
+	project = os.path.join(folder, "project")
+	cli = os.path.join(folder, "cli", "titanium.js")
+	recording = recording or {'android': fixtureInfo('android'), 'ios': fixtureInfo('ios')}
+	try:
+		os.makedirs(project)
+		tiappPath = os.path.join(project, "tiapp.xml")
+		writeTiApp(tiappPath)
+		benchmark(results, "tiapp.xml parse", lambda: Titanium.parseTiApp(tiappPath), runs)
+		benchmark(results, "tiapp.xml bump (dry run)", lambda: Titanium.bumpBuildNumbers(tiappPath, ios=True, android=True, dryRun=True), runs)
+
+		profilesDir = os.path.join(folder, "profiles")
+		os.makedirs(profilesDir)
+		writeProfiles(profilesDir, profileCount)
+		def coldScan():
+			Titanium.ProfileIndex(os.path.join(folder, uuid.uuid4().hex + ".json")).scan([profilesDir])
+		benchmark(results, "%d profiles, cold scan" % profileCount, coldScan, runs)
+		warmIndex = Titanium.ProfileIndex(os.path.join(folder, "profiles.json"))
+		warmIndex.scan([profilesDir])
+		benchmark(results, "%d profiles, rescan" % profileCount, lambda: warmIndex.scan([profilesDir]), runs)
+
+		archive = fontelloArchive()
+		client = Titanium.FontelloClient()
+		benchmark(results, "fontello zip extract", lambda: client.extract(BytesIO(archive), extras=True), runs)
+
+		writeStubCli(os.path.dirname(cli), recording, latency)
+		for platform in ('android', 'ios'):
+			benchmark(results, "info %s, stub cli %gs" % (platform, latency), lambda: Titanium.fetchInfo(node, cli, BENCHMARK_SDK, project, platform, refresh=True), runs)
+			benchmark(results, "info %s, cached" % platform, lambda: Titanium.fetchInfo(node, cli, BENCHMARK_SDK, project, platform), runs)
+		def parseIosEnvironment():
+			environment = Titanium.IosEnvironment(recording['ios'])
+			for keychain in environment.keychains():
+				environment.certs(keychain, 'developer')
+			for target in Titanium.IOS_PROFILE_GROUPS:
+				environment.profiles(target)
+			environment.simulators()
+		benchmark(results, "ios environment parse", parseIosEnvironment, runs)
+	finally:
+		with Titanium.cliLock:
+			daemon = Titanium.cliDaemons.pop((node, cli, BENCHMARK_SDK), None)
+		if daemon is not None:
+			daemon.stop()
+		for path in [Titanium.infoCachePath('android', BENCHMARK_SDK), Titanium.infoCachePath('ios', BENCHMARK_SDK), Titanium.timingsPath(project)]:
+			if os.path.isfile(path):
+				os.remove(path)
+		shutil.rmtree(folder, True)
+	return results
+
+def report(results):
+	lines = ["%-40s %6s %10s %10s %10s" % ("benchmark", "runs", "min", "p50", "p95")]
+	for name, durations in results:
+		if isinstance(durations, Exception):
+			lines.append("%-40s failed: %s" % (name, durations))
+		else:
+			lines.append("%-40s %6d %8.1fms %8.1fms %8.1fms" % (name, len(durations), min(durations) * 1000, Titanium.percentile(durations, 50) * 1000, Titanium.percentile(durations, 95) * 1000))
+	return "\n".join(lines) + "\n"
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="times the hot paths of the Titanium plugin")
+	parser.add_argument("--node", default=shutil.which("node"))
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--latency", type=float, default=0.2)
+	parser.add_argument("--recorded", help="cache folder of the plugin, its recorded info replaces the fixtures")
+	args = parser.parse_args()
+	if args.node is None:
+		sys.exit("node is needed for the stub CLI")
+	Titanium.CACHE_FOLDER = tempfile.mkdtemp(prefix="titanium-benchmark-cache-")
+	try:
+		recording = {'android': recordedInfo('android', args.recorded), 'ios': recordedInfo('ios', args.recorded)}
+		# the plugin logs every CLI call, only the report goes to stdout
+		with contextlib.redirect_stdout(sys.stderr):
+			results = runBenchmarks(args.node, args.runs, args.latency, recording=recording)
+		print(report(results))
+	finally:
+		shutil.rmtree(Titanium.CACHE_FOLDER, True)
@@ -0,0 +1,204 @@
+# Headless stand-in for Sublime Text's sublime module, only the parts of the API the plugin uses.
+# Quick panels answer with the choices scripted on the window, set_timeout runs the callback right away.
+import collections
+import itertools
+import os
+import tempfile
+import threading
+
+ENCODED_POSITION = 1
+TRANSIENT = 4
+
+_settings = {}
+_windows = []
+_ids = itertools.count(1)
+
+class Region(object):
+
+	def __init__(self, a, b=None):
+		self.a = a
+		self.b = a if b is None else b
+
+class Settings(object):
+
+	def __init__(self, values=None):
+		self.values = dict(values or {})
+		self.callbacks = {}
+
+	def get(self, key, default=None):
+		return self.values.get(key, default)
+
+	def set(self, key, value):
+		self.values[key] = value
+		for callback in list(self.callbacks.values()):
+			callback()
+
+	def has(self, key):
+		return key in self.values
+
+	def erase(self, key):
+		self.values.pop(key, None)
+
+	def add_on_change(self, tag, callback):
+		self.callbacks[tag] = callback
+
+	def clear_on_change(self, tag):
+		self.callbacks.pop(tag, None)
+
+class Selection(list):
+
+	def clear(self):
+		del self[:]
+
+	def add(self, region):
+		self.append(region)
+
+class View(object):
+
+	def __init__(self, window=None, fileName=None):
+		self._window = window
+		self._fileName = fileName
+		self._settings = Settings()
+		self._sel = Selection()
+		self.text = ''
+		self.status = {}
+
+	def window(self):
+		return self._window
+
+	def file_name(self):
+		return self._fileName
+
+	def is_dirty(self):
+		return False
+
+	def settings(self):
+		return self._settings
+
+	def run_command(self, cmd, args=None):
+		args = args or {}
+		if cmd == 'append':
+			self.text += args['characters']
+		elif cmd == 'titanium_trim_panel':
+			self.text = '\n'.join(self.text.split('\n')[args['lines']:])
+
+	def size(self):
+		return len(self.text)
+
+	def text_point(self, row, col):
+		return sum(len(line) + 1 for line in self.text.split('\n')[:row]) + col
+
+	def set_read_only(self, flag):
+		pass
+
+	def sel(self):
+		return self._sel
+
+	def show(self, point):
+		pass
+
+	def set_status(self, key, value):
+		self.status[key] = value
+
+	def erase_status(self, key):
+		self.status.pop(key, None)
+
+class Window(object):
+
+	def __init__(self, folders=(), choices=()):
+		self._id = next(_ids)
+		self._folders = list(folders)
+		self.choices = collections.deque(choices)
+		self.panels = {}
+		self.commands = []
+		self.errors = []
+		self.commandRun = threading.Event()
+		self.view = View(self)
+
+	def id(self):
+		return self._id
+
+	def folders(self):
+		return list(self._folders)
+
+	def project_data(self):
+		return None
+
+	def active_view(self):
+		return self.view
+
+	def views(self):
+		return [self.view]
+
+	def active_panel(self):
+		return None
+
+	def create_output_panel(self, name):
+		self.panels[name] = View(self)
+		return self.panels[name]
+
+	def find_output_panel(self, name):
+		return self.panels.get(name)
+
+	def open_file(self, path, flags=0):
+		return View(self, path)
+
+	def run_command(self, cmd, args=None):
+		self.commands.append((cmd, args or {}))
+		self.commandRun.set()
+
+	def show_quick_panel(self, items, on_select, flags=0, selected_index=-1, on_highlight=None):
+		# picks the next scripted choice, matched against the first line of every item
+		labels = [item[0] if isinstance(item, (list, tuple)) else item for item in items]
+		choice = self.choices.popleft() if self.choices else None
+		if choice not in labels:
+			self.errors.append("no %r in the quick panel %r" % (choice, labels))
+			on_select(-1)
+			return
+		on_select(labels.index(choice))
+
+	def show_input_panel(self, caption, initial_text, on_done, on_change, on_cancel):
+		on_done(self.choices.popleft() if self.choices else initial_text)
+
+def load_settings(name):
+	return _settings.setdefault(name, Settings())
+
+def set_timeout(callback, delay=0):
+	callback()
+
+def set_timeout_async(callback, delay=0):
+	callback()
+
+def status_message(message):
+	pass
+
+def message_dialog(message):
+	pass
+
+def error_message(message):
+	for window in _windows:
+		window.errors.append(message)
+
+def ok_cancel_dialog(message, ok_title=""):
+	return False
+
+def log_commands(flag):
+	pass
+
+def platform():
+	return "osx"
+
+def arch():
+	return "x64"
+
+def version():
+	return "4000"
+
+def cache_path():
+	return os.path.join(tempfile.gettempdir(), "sublime-cache")
+
+def active_window():
+	return _windows[-1] if _windows else None
+
+def windows():
+	return list(_windows)
@@ -0,0 +1,22 @@
+# Headless stand-in for Sublime Text's sublime_plugin module, see sublime.py next to it
+
+class ApplicationCommand(object):
+	pass
+
+class WindowCommand(object):
+
+	def __init__(self, window):
+		self.window = window
+
+class TextCommand(object):
+
+	def __init__(self, view):
+		self.view = view
+
+class EventListener(object):
+	pass
+
+class ViewEventListener(object):
+
+	def __init__(self, view):
+		self.view = view
@@ -0,0 +1,154 @@
+# Headless benchmark of the plugin, runs on any box with python 3 and node:
+#
+#   python3 benchmark/test_benchmark.py    prints the timings
+#   python3 -m pytest benchmark            fails when a case gets slower than its baseline
+#
+# The sublime/sublime_plugin modules next to this file stand in for Sublime Text, the Titanium CLI is
+# fixtures/stub_cli.js answering with the recorded info of fixtures/ after STUB_LATENCY seconds.
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import sublime
+import Titanium
+import hotpaths
+
+NODE = shutil.which("node")
+RUNS = int(os.environ.get("TITANIUM_BENCHMARK_RUNS", 3))
+STUB_LATENCY = 0.05
+
+# (platform, target, quick panel choices from the platform picker to the build)
+FLOWS = [
+	("android", "emulator auto", ["android", "emulator auto"]),
+	("android", "emulator", ["android", "emulator", "more...", "Pixel_8_API_34"]),
+	("android", "device", ["android", "device"]),
+	("android", "dist-adhoc", ["android", "dist-adhoc"]),
+	("android", "dist-playstore", ["android", "dist-playstore"]),
+	("ios", "simulator", ["ios", "simulator", "iPhone 15"]),
+	("ios", "simulator auto", ["ios", "simulator auto"]),
+	("ios", "device", ["ios", "device", "iphone", "/Users/dev/Library/Keychains/login.keychain-db", "Jane Developer (ABCDE12345)", "Example Development 3"]),
+	("ios", "device-adhoc", ["ios", "device-adhoc", "universal", "/Users/dev/Library/Keychains/login.keychain-db", "Example Adhoc 1"]),
+	("ios", "dist-adhoc", ["ios", "dist-adhoc", "ipad", "/Users/dev/Library/Keychains/login.keychain-db", "Example Adhoc 2"]),
+	("ios", "dist-appstore", ["ios", "dist-appstore", "iphone", "/Users/dev/Library/Keychains/login.keychain-db", "Example AppStore 0"]),
+	("mobileweb", "development", ["mobileweb", "development"]),
+	("mobileweb", "production", ["mobileweb", "production"])
+]
+
+# p50 in seconds every case has to stay below, generous enough for a loaded CI box
+FLOW_BASELINE = 2.0
+BASELINES = {
+	"tiapp.xml parse": 0.05,
+	"tiapp.xml bump (dry run)": 0.05,
+	"50 profiles, cold scan": 1.0,
+	"50 profiles, rescan": 0.1,
+	"fontello zip extract": 0.1,
+	"ios environment parse": 0.05
+}
+
+def fixture(name):
+	return os.path.join(HERE, "fixtures", name)
+
+class Harness(object):
+
+	# a temp project, cache folder and stub CLI, the plugin's caches pointed at them
+	def __init__(self):
+		self.folder = tempfile.mkdtemp(prefix="titanium-harness-")
+		self.project = os.path.join(self.folder, "project")
+		os.makedirs(os.path.join(self.project, "app"))
+		hotpaths.writeTiApp(os.path.join(self.project, "tiapp.xml"))
+		self.recording = {'android': hotpaths.fixtureInfo('android'), 'ios': hotpaths.fixtureInfo('ios')}
+		self.cli = hotpaths.writeStubCli(os.path.join(self.folder, "cli"), self.recording, STUB_LATENCY)
+		cache = os.path.join(self.folder, "cache")
+		Titanium.CACHE_FOLDER = cache
+		Titanium.history = Titanium.HistoryStore(os.path.join(cache, "history.json"))
+		Titanium.profileIndex = Titanium.ProfileIndex(os.path.join(cache, "profiles.json"))
+		Titanium.fontelloSessions = Titanium.FontelloSessions(os.path.join(cache, "fontello_sessions.json"))
+		settings = sublime.load_settings(Titanium.SETTINGS_FILE)
+		settings.values.update({
+			"nodejs": NODE,
+			"titaniumCLI": self.cli,
+			"androidSDK": os.path.join(self.folder, "android-sdk"),
+			"loggingLevel": "info",
+			"outputDir": "release",
+			"iosSimctlFixture": fixture("simctl.json"),
+			"cliDaemon": False
+		})
+		Titanium.plugin_loaded()
+
+	def close(self):
+		Titanium.plugin_unloaded()
+		shutil.rmtree(self.folder, True)
+
+	def runFlow(self, choices, timeout=30):
+		# cold start: nothing prefetched or cached, returns (seconds, window)
+		Titanium.forgetPrefetch()
+		Titanium.clearInfoCache()
+		window = sublime.Window([self.project], choices)
+		sublime._windows.append(window)
+		try:
+			start = time.time()
+			Titanium.TitaniumCommand(window).run()
+			if not window.commandRun.wait(timeout):
+				window.errors.append("no build started within %ds" % timeout)
+			return time.time() - start, window
+		finally:
+			sublime._windows.remove(window)
+
+	def flowTimings(self, runs=RUNS):
+		# [(name, durations or error)]
+		results = []
+		for platform, target, choices in FLOWS:
+			durations = []
+			for i in range(runs):
+				duration, window = self.runFlow(choices)
+				command = window.commands[-1] if window.commands else (None, {})
+				cmd = command[1].get("cmd") or []
+				if window.errors or command[0] != "titanium_exec" or cmd[cmd.index("--platform") + 1:][:1] != [platform]:
+					durations = AssertionError("%s %s: %s %s" % (platform, target, window.errors, command))
+					break
+				durations.append(duration)
+			results.append(("picker to exec, %s %s" % (platform, target), durations))
+		return results
+
+	def hotPathTimings(self, runs=RUNS):
+		return hotpaths.runBenchmarks(NODE, runs, STUB_LATENCY, 50, self.recording)
+
+class BenchmarkTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		if NODE is None:
+			raise unittest.SkipTest("node is needed for the stub CLI")
+		cls.harness = Harness()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.harness.close()
+
+	def check(self, results):
+		report = hotpaths.report(results)
+		for name, durations in results:
+			self.assertNotIsInstance(durations, Exception, report)
+			baseline = BASELINES.get(name, FLOW_BASELINE)
+			self.assertLess(Titanium.percentile(durations, 50), baseline, name + " is slower than its baseline\n" + report)
+
+	def test_picker_to_exec(self):
+		self.check(self.harness.flowTimings())
+
+	def test_hot_paths(self):
+		self.check(self.harness.hotPathTimings())
+
+if __name__ == '__main__':
+	if NODE is None:
+		sys.exit("node is needed for the stub CLI")
+	harness = Harness()
+	try:
+		print(hotpaths.report(harness.flowTimings() + harness.hotPathTimings()))
+	finally:
+		harness.close()
@@ -0,0 +1,171 @@
+# Fontello client and session cache checks against a local stub of fontello.com:
+#
+#   python3 -m pytest benchmark/test_fontello.py
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from zipfile import ZipFile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import Titanium
+
+TTF = os.urandom(32 * 1024)
+CONFIG = json.dumps({'name': 'icons', 'glyphs': [{'css': 'icon-%d' % i, 'code': 0xe800 + i} for i in range(20)]}).encode('utf-8')
+
+def fontelloArchive(config):
+	archive = BytesIO()
+	with ZipFile(archive, 'w') as zipfile:
+		zipfile.writestr('fontello-stub/config.json', config)
+		zipfile.writestr('fontello-stub/font/icons.ttf', TTF)
+		zipfile.writestr('fontello-stub/css/fontello.css', '.icon-0:before { content: "\\e800"; }')
+	return archive.getvalue()
+
+class StubFontello(HTTPServer):
+
+	# POST / creates a session for the uploaded config, GET /<id> checks it, GET /<id>/get downloads it
+	def __init__(self):
+		HTTPServer.__init__(self, ('127.0.0.1', 0), StubFontelloHandler)
+		self.sessions = {}
+		self.uploads = 0
+		threading.Thread(target=self.serve_forever, daemon=True).start()
+
+	def url(self):
+		return "http://127.0.0.1:%d" % self.server_address[1]
+
+	def close(self):
+		self.shutdown()
+		self.server_close()
+
+class StubFontelloHandler(BaseHTTPRequestHandler):
+
+	def log_message(self, *args):
+		pass
+
+	def answer(self, code, body=b''):
+		self.send_response(code)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers['Content-Length']))
+		config = body.split(b'\r\n\r\n', 1)[1].rsplit(b'\r\n--', 1)[0]
+		sessionId = uuid.uuid4().hex
+		self.server.sessions[sessionId] = config
+		self.server.uploads += 1
+		self.answer(200, sessionId.encode('ascii'))
+
+	def do_GET(self):
+		parts = self.path.strip('/').split('/')
+		config = self.server.sessions.get(parts[0])
+		if config is None:
+			self.answer(404)
+		elif parts[1:] == ['get']:
+			self.answer(200, fontelloArchive(config))
+		else:
+			self.answer(200)
+
+class FontelloClientTest(unittest.TestCase):
+
+	def setUp(self):
+		self.server = StubFontello()
+		self.client = Titanium.FontelloClient(host=self.server.url(), timeout=10)
+		self.folder = tempfile.mkdtemp(prefix="titanium-fontello-")
+
+	def tearDown(self):
+		self.server.close()
+		shutil.rmtree(self.folder, True)
+
+	def downloadAndExtract(self):
+		sessionId = self.client.createSession(CONFIG)
+		archive = self.client.download(sessionId)
+		with archive:
+			return archive, self.client.extract(archive, True)
+
+	def test_download_in_memory(self):
+		archive, files = self.downloadAndExtract()
+		self.assertIsInstance(archive, BytesIO)
+		self.assertEqual(files['config'], CONFIG)
+		self.assertEqual(files['ttf'], TTF)
+		self.assertIn('css/fontello.css', files)
+
+	def test_download_spills_to_temp_file(self):
+		limit = Titanium.MAX_FONTELLO_BUFFER
+		Titanium.MAX_FONTELLO_BUFFER = 1024
+		try:
+			archive, files = self.downloadAndExtract()
+		finally:
+			Titanium.MAX_FONTELLO_BUFFER = limit
+		self.assertNotIsInstance(archive, BytesIO)
+		self.assertEqual(files['ttf'], TTF)
+
+class FontelloSessionsTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		Titanium.plugin_loaded()
+
+	@classmethod
+	def tearDownClass(cls):
+		Titanium.plugin_unloaded()
+
+	def setUp(self):
+		self.server = StubFontello()
+		self.client = Titanium.FontelloClient(host=self.server.url(), timeout=10)
+		self.folder = tempfile.mkdtemp(prefix="titanium-fontello-")
+		self.sessions = Titanium.FontelloSessions(os.path.join(self.folder, "fontello_sessions.json"))
+
+	def tearDown(self):
+		for key in ("fontelloSessionExpiry", "fontelloValidateSessions"):
+			Titanium.settings.erase(key)
+		Titanium.settingsResolver.invalidate()
+		self.server.close()
+		shutil.rmtree(self.folder, True)
+
+	def test_session_is_validated_against_the_server(self):
+		sessionId = self.client.createSession(CONFIG)
+		self.assertEqual(self.server.sessions[sessionId], CONFIG)
+		self.assertTrue(self.client.isSessionValid(sessionId))
+		self.assertFalse(self.client.isSessionValid(uuid.uuid4().hex))
+
+	def test_session_is_reused_for_the_same_config(self):
+		sessionId = self.sessions.get(CONFIG, self.client)
+		self.assertEqual(self.sessions.get(CONFIG, self.client), sessionId)
+		self.assertEqual(self.server.uploads, 1)
+		# a new index reads the same cache file
+		again = Titanium.FontelloSessions(self.sessions.path)
+		self.assertEqual(again.get(CONFIG, self.client), sessionId)
+		self.assertEqual(self.server.uploads, 1)
+
+	def test_expired_session_is_uploaded_again(self):
+		self.sessions.get(CONFIG, self.client)
+		Titanium.settings.set("fontelloSessionExpiry", 0)
+		self.sessions.get(CONFIG, self.client)
+		self.assertEqual(self.server.uploads, 2)
+
+	def test_session_the_server_forgot_is_uploaded_again(self):
+		sessionId = self.sessions.get(CONFIG, self.client)
+		del self.server.sessions[sessionId]
+		Titanium.settings.set("fontelloValidateSessions", True)
+		self.assertNotEqual(self.sessions.get(CONFIG, self.client), sessionId)
+		self.assertEqual(self.server.uploads, 2)
+
+	def test_failed_cache_write_keeps_the_session(self):
+		blocker = os.path.join(self.folder, "file")
+		open(blocker, 'w').close()
+		sessions = Titanium.FontelloSessions(os.path.join(blocker, "fontello_sessions.json"))
+		sessionId = sessions.get(CONFIG, self.client)
+		self.assertIn(sessionId, self.server.sessions)
+		self.assertEqual(sessions.get(CONFIG, self.client), sessionId)
+
+if __name__ == '__main__':
+	unittest.main()